@@ -0,0 +1,370 @@
+"""
+Offline load test for the Telegram bot: no real quota, tokens or Telegram traffic.
+Starts benchmarks/fake_upstreams.py (YouTube v3, Groq, Bot API stand-ins) in a
+subprocess, points bot.py at it, and replays synthetic user sessions
+(menu button -> channel / titles / channel list ...) through the real router with
+dp.feed_update at a fixed concurrency. Channels are drawn from a Zipf-like pool,
+so caches, coalescing and the LLM cache see realistic reuse. Reports throughput,
+p50/p95/p99 per step, upstream call counts and memory; --json saves the result and
+--baseline compares against a saved one (exit code 1 on regression).
+--shared-storage adds the fake's Redis stand-in as SHARED_STORAGE_URL, so FSM state
+goes through KVStorage and the caches write behind to / read through from L2; with
+--warmup the in-process caches are then emptied, like a fresh replica joining.
+Run: python benchmarks/bench_bot.py [--sessions 500] [--concurrency 50]
+     [--mix analyze=4,tips=2,titles=2,compare=1,deep=1] [--groq-429 0.05] [--shared-storage]
+     [--json out.json]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "python_bot"))
+
+import fake_upstreams  # noqa: E402
+
+# scenario -> steps of (label, update kind, payload template)
+SCENARIOS = {
+    "analyze": [("menu", "callback", "action_analyze_channel"), ("lookup", "message", "{channel}")],
+    "tips": [("menu", "callback", "action_ai_tips_prompt"), ("lookup", "message", "{channel}")],
+    "deep": [("menu", "callback", "action_analyze_channel"), ("lookup", "message", "{channel}"),
+             ("deep", "callback", "deep_{channel_id}")],
+    "compare": [("menu", "callback", "action_compare_channels"), ("list", "message", "{channels}")],
+    "titles": [("menu", "callback", "action_tool_titles"), ("generate", "message", "{titles}")],
+}
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench"}
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return 0.0
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KB elsewhere
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fakes(args) -> tuple:
+    """Returns (process, HTTP base URL, redis:// URL or "")."""
+    port = free_port()
+    redis_port = free_port() if args.shared_storage else 0
+    cmd = [sys.executable, os.path.join(HERE, "fake_upstreams.py"), "--port", str(port),
+           "--redis-port", str(redis_port),
+           "--yt-latency", str(args.yt_latency), "--groq-latency", str(args.groq_latency),
+           "--groq-tps", str(args.groq_tps), "--groq-tokens", str(args.groq_tokens),
+           "--groq-429", str(args.groq_429), "--tg-latency", str(args.tg_latency),
+           "--max-videos", str(args.max_videos)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    redis_url = f"redis://127.0.0.1:{redis_port}/0" if redis_port else ""
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base + "/__stats", timeout=1).read()
+            return proc, base, redis_url
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise SystemExit("fake upstreams did not start")
+
+
+def fake_stats(base: str, reset: bool = False) -> dict:
+    if reset:
+        urllib.request.urlopen(urllib.request.Request(base + "/__reset", method="POST")).read()
+        return {}
+    return json.loads(urllib.request.urlopen(base + "/__stats").read())
+
+
+class Workload:
+    """Deterministic synthetic sessions: which scenario, which channels, which prompts."""
+
+    def __init__(self, args):
+        self.rng = random.Random(args.seed)
+        self.mix = parse_mix(args.mix)
+        self.channels = [f"chan{n}" for n in range(args.channels)]
+        # Zipf-like popularity: a few channels get most of the lookups
+        self.channel_weights = list(itertools.accumulate(1 / (n + 1) for n in range(args.channels)))
+        self.search_share = args.search_share
+        self.compare_size = args.compare_size
+        self.titles = [f"Как я заработал {n * 100}$ на YouTube\nПочему мой канал вырос на {n}%"
+                       for n in range(args.prompts)]
+
+    def channel(self) -> str:
+        name = self.rng.choices(self.channels, cum_weights=self.channel_weights)[0]
+        # Free text goes through search.list (100 units), @handles through channels?forHandle
+        return f"{name} official" if self.rng.random() < self.search_share else f"@{name}"
+
+    def session(self) -> tuple:
+        scenario = self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        channel = self.channel()
+        values = {
+            "channel": channel,
+            "channel_id": fake_upstreams.channel_id_for(channel.lstrip("@")),
+            "channels": "\n".join(self.channel() for _ in range(self.compare_size)),
+            "titles": self.rng.choice(self.titles),
+        }
+        return scenario, [(label, kind, template.format(**values)) for label, kind, template in SCENARIOS[scenario]]
+
+
+class Driver:
+    def __init__(self, bot_module):
+        self.bot_module = bot_module
+        self.ids = itertools.count(1)
+        self.steps = defaultdict(list)     # "scenario.step" -> latencies
+        self.sessions = defaultdict(list)  # scenario -> latencies
+        self.errors = defaultdict(int)
+
+    def update(self, user_id: int, kind: str, payload: str):
+        from aiogram.types import Update
+
+        user = {"id": user_id, "is_bot": False, "first_name": "User"}
+        chat = {"id": user_id, "type": "private"}
+        now = int(time.time())
+        if kind == "message":
+            raw = {"message_id": next(self.ids), "date": now, "chat": chat, "from": user, "text": payload}
+            data = {"update_id": next(self.ids), "message": raw}
+        else:
+            menu = {"message_id": next(self.ids), "date": now, "chat": chat, "from": BOT_USER, "text": "menu"}
+            data = {"update_id": next(self.ids), "callback_query": {
+                "id": str(next(self.ids)), "from": user, "chat_instance": "bench", "data": payload, "message": menu,
+            }}
+        return Update.model_validate(data, context={"bot": self.bot_module.bot})
+
+    async def run_session(self, user_id: int, scenario: str, steps: list):
+        dp, bot = self.bot_module.dp, self.bot_module.bot
+        started = time.perf_counter()
+        for label, kind, payload in steps:
+            t0 = time.perf_counter()
+            try:
+                await dp.feed_update(bot, self.update(user_id, kind, payload))
+            except Exception as e:
+                self.errors[f"{scenario}.{label}: {type(e).__name__}"] += 1
+            self.steps[f"{scenario}.{label}"].append(time.perf_counter() - t0)
+        self.sessions[scenario].append(time.perf_counter() - started)
+
+    async def run(self, sessions: list, concurrency: int, first_user: int) -> float:
+        queue = asyncio.Queue()
+        for n, session in enumerate(sessions):
+            queue.put_nowait((first_user + n, *session))
+
+        async def worker():
+            while not queue.empty():
+                user_id, scenario, steps = queue.get_nowait()
+                await self.run_session(user_id, scenario, steps)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+
+def summarize(latencies: dict) -> dict:
+    result = {}
+    for label, values in sorted(latencies.items()):
+        values = sorted(values)
+        result[label] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+            "max_ms": round(values[-1] * 1000, 1),
+        }
+    return result
+
+
+def cache_delta(before: dict, after: dict) -> dict:
+    result = {}
+    for name, stats in after.items():
+        d = {k: stats[k] - before[name].get(k, 0) for k in ("hits", "stale_hits", "misses")}
+        lookups = sum(d.values())
+        result[name] = round((d["hits"] + d["stale_hits"]) / lookups, 3) if lookups else None
+    return result
+
+
+async def bench(args, base: str) -> dict:
+    import bot as bot_module
+    import services
+
+    await services.start()
+    driver = Driver(bot_module)
+    workload = Workload(args)
+    try:
+        caches = (services.channel_id_cache, services.channel_stats_cache, services.latest_video_cache)
+        if args.warmup:
+            await driver.run([workload.session() for _ in range(args.warmup)], args.concurrency, 1_000_000)
+            driver = Driver(bot_module)
+            if services.shared_kv:
+                # A fresh replica: empty L1, warm L2
+                for c in caches:
+                    await c.flush()
+                    c._data.clear()
+        fake_stats(base, reset=True)
+
+        cache_before = {c.name: dict(c.stats) for c in caches}
+        kv_before = services.shared_kv.snapshot() if services.shared_kv else None
+        quota_before = services.quota.used()
+        rss_before = rss_mb()
+
+        sessions = [workload.session() for _ in range(args.sessions)]
+        elapsed = await driver.run(sessions, args.concurrency, 1)
+        updates = sum(len(v) for v in driver.steps.values())
+
+        llm = services.llm_cache.snapshot()["tools"]
+        return {
+            "config": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")},
+            "elapsed_s": round(elapsed, 2),
+            "sessions_per_s": round(args.sessions / elapsed, 1),
+            "updates_per_s": round(updates / elapsed, 1),
+            "steps": summarize(driver.steps),
+            "sessions": summarize(driver.sessions),
+            "errors": dict(driver.errors),
+            "upstream": dict(sorted(fake_stats(base).items())),
+            "youtube_quota_units": services.quota.used() - quota_before,
+            "cache_hit_rate": cache_delta(cache_before, {c.name: c.stats for c in caches}),
+            "l2": {c.name: {k: c.stats[k] - cache_before[c.name][k] for k in ("l2_hits", "l2_errors")}
+                   for c in caches} if kv_before else None,
+            "shared_kv": {k: v - kv_before[k] for k, v in services.shared_kv.snapshot().items()
+                          if isinstance(v, int)} if kv_before else None,
+            "llm_cache_hit_rate": {t: s["hit_rate"] for t, s in llm.items()},
+            "memory_mb": {"rss_before": round(rss_before, 1), "rss_after": round(rss_mb(), 1),
+                          "rss_peak": round(max(peak_rss_mb(), rss_mb()), 1)},
+        }
+    finally:
+        await services.close()
+        await bot_module.bot.session.close()
+
+
+def print_report(r: dict):
+    c = r["config"]
+    print(f"{c['sessions']} sessions x concurrency {c['concurrency']} in {r['elapsed_s']}s: "
+          f"{r['sessions_per_s']} sessions/s, {r['updates_per_s']} updates/s")
+    print(f"\n{'step':<22} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for section in ("steps", "sessions"):
+        for label, s in r[section].items():
+            name = label if section == "steps" else f"[{label}]"
+            print(f"{name:<22} {s['count']:>6} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f} "
+                  f"{s['max_ms']:>9.1f}")
+    print("\nupstream calls: " + ", ".join(f"{k}={v}" for k, v in r["upstream"].items()))
+    print(f"youtube quota units: {r['youtube_quota_units']}")
+    print("cache hit rate: " + ", ".join(f"{k}={v}" for k, v in r["cache_hit_rate"].items())
+          + "; llm: " + (", ".join(f"{k}={v}" for k, v in r["llm_cache_hit_rate"].items()) or "-"))
+    if r.get("shared_kv"):
+        print("shared storage: " + ", ".join(f"{k}={v}" for k, v in r["shared_kv"].items())
+              + "; L2 hits: " + ", ".join(f"{k}={v['l2_hits']}" for k, v in r["l2"].items()))
+    m = r["memory_mb"]
+    print(f"memory: rss {m['rss_before']} -> {m['rss_after']} MB (peak {m['rss_peak']} MB)")
+    if r["errors"]:
+        print("errors: " + ", ".join(f"{k} x{v}" for k, v in r["errors"].items()))
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions beyond ``tolerance`` (relative) in throughput, step p95 and upstream calls."""
+    problems = []
+    if result["updates_per_s"] < baseline["updates_per_s"] * (1 - tolerance):
+        problems.append(f"throughput {baseline['updates_per_s']} -> {result['updates_per_s']} updates/s")
+    for label, old in baseline["steps"].items():
+        new = result["steps"].get(label)
+        # Sub-5ms steps are all noise
+        if new and new["p95_ms"] > max(old["p95_ms"] * (1 + tolerance), 5):
+            problems.append(f"{label} p95 {old['p95_ms']} -> {new['p95_ms']} ms")
+    for key, old in baseline["upstream"].items():
+        new = result["upstream"].get(key, 0)
+        if new > old * (1 + tolerance) + 1:
+            problems.append(f"{key} calls {old} -> {new}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=0, help="sessions to run (and discard) before measuring")
+    parser.add_argument("--mix", default="analyze=4,tips=2,titles=2,compare=1,deep=1")
+    parser.add_argument("--channels", type=int, default=200, help="size of the channel pool")
+    parser.add_argument("--search-share", type=float, default=0.05, help="share of lookups sent as free text")
+    parser.add_argument("--compare-size", type=int, default=10, help="channels per /compare list")
+    parser.add_argument("--prompts", type=int, default=50, help="distinct title pairs for the titles tool")
+    parser.add_argument("--quota", type=int, default=10 ** 9, help="YOUTUBE_DAILY_QUOTA for the run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--shared-storage", action="store_true",
+                        help="use the fake Redis as SHARED_STORAGE_URL (FSM state and cache L2)")
+    fake_upstreams.add_arguments(parser)
+    parser.add_argument("--json", help="write the result to this file")
+    parser.add_argument("--baseline", help="compare against a saved --json result")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    proc, base, redis_url = start_fakes(args)
+    workdir = tempfile.mkdtemp(prefix="bench_bot_")
+    # Endpoints, keys and state files are forced; tuning knobs (GROQ_CONCURRENCY, CACHE_*...) pass through
+    os.environ.update({
+        "BOT_TOKEN": "123456:BENCH",
+        "YOUTUBE_API_KEY": "bench", "YOUTUBE_API_KEYS": "", "GROQ_API_KEY": "bench",
+        "YOUTUBE_API_URL": f"{base}/youtube/v3",
+        "GROQ_API_URL": f"{base}/openai/v1/chat/completions",
+        "TELEGRAM_API_URL": base,
+        "YOUTUBE_DAILY_QUOTA": str(args.quota),
+        "SNAPSHOT_DB_PATH": os.path.join(workdir, "snapshots.db"),
+        "QUOTA_DB_PATH": os.path.join(workdir, "quota.db"),
+        "LLM_CACHE_BACKEND": "memory",
+        "SHARED_STORAGE_URL": redis_url,
+        "TELEMETRY_DUMP_INTERVAL": "0",
+    })
+    try:
+        result = asyncio.run(bench(args, base))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(result, json.load(f), args.tolerance)
+        print("\nvs baseline: " + ("OK" if not problems else "REGRESSION"))
+        for problem in problems:
+            print(f"  {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Micro-benchmark for the NumPy channel metrics engine.
+Builds synthetic channels with 10k-100k videos and times compute_channel_metrics.
+Run: python benchmarks/bench_metrics.py [--sizes 10000,50000,100000] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python_bot"))
+
+from deep import VideoColumns  # noqa: E402
+from metrics import columns_to_arrays, compute_channel_metrics  # noqa: E402
+
+
+def synthetic_channel(n: int, seed: int = 42) -> VideoColumns:
+    """Log-normal views, ~4% like rate, a few viral outliers, uploads over ~10 years."""
+    rng = np.random.default_rng(seed)
+    now = time.time()
+    views = rng.lognormal(mean=10, sigma=1.2, size=n).astype(np.int64)
+    viral = rng.choice(n, size=max(1, n // 500), replace=False)
+    views[viral] *= 50
+    likes = (views * rng.uniform(0.01, 0.08, size=n)).astype(np.int64)
+    comments = (likes * rng.uniform(0.02, 0.1, size=n)).astype(np.int64)
+    published = np.sort(now - rng.uniform(0, 10 * 365 * 86400, size=n))
+
+    cols = VideoColumns()
+    cols.views.frombytes(views.tobytes())
+    cols.likes.frombytes(likes.tobytes())
+    cols.comments.frombytes(comments.tobytes())
+    cols.published.frombytes(published.tobytes())
+    return cols
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="10000,50000,100000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'videos':>8} {'columns KB':>11} {'best ms':>9} {'median ms':>10} {'videos/s':>12}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        cols = synthetic_channel(n)
+        arrays = columns_to_arrays(cols)
+        now = time.time()
+        compute_channel_metrics(*arrays, now=now)  # warm-up
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            compute_channel_metrics(*arrays, now=now)
+            samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        median = samples[len(samples) // 2]
+        print(f"{n:>8} {cols.nbytes() / 1024:>11.0f} {samples[0]:>9.2f} {median:>10.2f} {n / (median / 1000):>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
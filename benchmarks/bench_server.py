@@ -0,0 +1,185 @@
+"""
+Static server benchmark: legacy dev server vs. `server.py --prod`.
+Simulates Mini App opens (index.html + every script/stylesheet) from concurrent
+clients, cold (empty browser cache) and warm (cached, revalidating), plus an
+optional slow client that trickles its request line in.
+Run: python benchmarks/bench_server.py [--clients 16] [--opens 20] [--slow 1.0]
+"""
+import argparse
+import functools
+import gzip
+import http.client
+import os
+import re
+import socket
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import server  # noqa: E402
+
+ACCEPT = {"Accept-Encoding": "gzip, deflate, br"}
+ASSET_RE = re.compile(r'''(?:src|href)=["']([\w.-]+\.(?:js|css))["']''')
+
+
+class QuietLegacyHandler(server.CORSHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Browser:
+    """Tiny browser model: one connection (kept alive if the server allows) plus an HTTP cache."""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.conn = None
+        self.cache = {}  # path -> (validators, cache-control)
+        self.requests = 0
+        self.bytes = 0
+
+    def _get(self, path: str, headers: dict):
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+            try:
+                self.conn.request("GET", path, headers=headers)
+                res = self.conn.getresponse()
+                body = res.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+        self.requests += 1
+        # Count header bytes too: 304s are not free
+        self.bytes += len(body) + sum(len(k) + len(v) + 4 for k, v in res.getheaders())
+        if res.getheader("Connection", "").lower() == "close" or res.version == 10:
+            self.conn.close()
+            self.conn = None
+        return res, body
+
+    def fetch(self, path: str) -> bytes:
+        cached = self.cache.get(path)
+        if cached and "immutable" in cached[1]:
+            return cached[2]
+        headers = dict(ACCEPT)
+        if cached:
+            validators = cached[0]
+            if validators.get("ETag"):
+                headers["If-None-Match"] = validators["ETag"]
+            if validators.get("Last-Modified"):
+                headers["If-Modified-Since"] = validators["Last-Modified"]
+        res, body = self._get(path, headers)
+        if res.status == 304:
+            return cached[2]
+        if res.getheader("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        validators = {k: res.getheader(k) for k in ("ETag", "Last-Modified")}
+        self.cache[path] = (validators, res.getheader("Cache-Control", ""), body)
+        return body
+
+    def open_app(self):
+        html = self.fetch("/index.html").decode("utf-8")
+        for asset in ASSET_RE.findall(html):
+            self.fetch("/" + asset)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+def slow_client(port: int, delay: float, stop: threading.Event):
+    """Send a request one byte per ``delay / len`` seconds, like a stalled mobile WebView."""
+    request = b"GET /index.html HTTP/1.1\r\nHost: localhost\r\n\r\n"
+    while not stop.is_set():
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=30) as sock:
+                for byte in request:
+                    sock.sendall(bytes([byte]))
+                    time.sleep(delay / len(request))
+                sock.recv(65536)
+        except OSError:
+            pass
+
+
+def run(httpd, clients: int, opens: int, slow: float) -> dict:
+    port = httpd.server_address[1]
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    stop = threading.Event()
+    if slow:
+        threading.Thread(target=slow_client, args=(port, slow, stop), daemon=True).start()
+        time.sleep(0.05)
+
+    results = {}
+    for phase in ("cold", "warm"):
+        browsers = [Browser(port) for _ in range(clients)]
+        if phase == "warm":
+            for b in browsers:
+                b.open_app()
+                b.requests = b.bytes = 0
+        latencies = []
+        lock = threading.Lock()
+
+        def worker(browser):
+            for i in range(opens):
+                if phase == "cold":
+                    browser.cache.clear()
+                t0 = time.perf_counter()
+                browser.open_app()
+                with lock:
+                    latencies.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(b,)) for b in browsers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        for b in browsers:
+            b.close()
+
+        latencies.sort()
+        requests = sum(b.requests for b in browsers)
+        results[phase] = {
+            "requests": requests,
+            "rps": requests / elapsed,
+            "kb_per_open": sum(b.bytes for b in browsers) / (clients * opens) / 1024,
+            "p50_ms": statistics.median(latencies) * 1000,
+            "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        }
+
+    stop.set()
+    httpd.shutdown()
+    httpd.server_close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--opens", type=int, default=20)
+    parser.add_argument("--slow", type=float, default=0.0,
+                        help="seconds a background slow client takes to send each request (0 = off)")
+    args = parser.parse_args()
+
+    legacy = server.ReuseAddrServer(("127.0.0.1", 0), functools.partial(QuietLegacyHandler, directory=ROOT))
+    prod = server.make_production_server(0, root=ROOT, quiet=True)
+
+    print(f"{args.clients} clients x {args.opens} Mini App opens"
+          + (f", slow client {args.slow:.1f}s/request" if args.slow else ""))
+    print(f"{'server':<8} {'phase':<5} {'requests':>9} {'req/s':>9} {'KB/open':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, httpd in (("legacy", legacy), ("prod", prod)):
+        for phase, r in run(httpd, args.clients, args.opens, args.slow).items():
+            print(f"{name:<8} {phase:<5} {r['requests']:>9} {r['rps']:>9.0f} {r['kb_per_open']:>9.1f} "
+                  f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
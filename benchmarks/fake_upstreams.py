@@ -0,0 +1,324 @@
+"""
+Local stand-ins for the YouTube Data API v3, Groq chat completions and the
+Telegram Bot API, all on one aiohttp port, plus an optional in-memory
+Redis-protocol server (GET/SET EX/MGET/DEL/PING, pipelining) for the shared
+storage backend. Responses are deterministic per channel, latencies are
+configurable, and Groq can inject 429s. Call counts (Redis commands included)
+are served at /__stats (and cleared by POST /__reset).
+Point the bot at it with:
+    YOUTUBE_API_URL=http://127.0.0.1:8765/youtube/v3
+    GROQ_API_URL=http://127.0.0.1:8765/openai/v1/chat/completions
+    TELEGRAM_API_URL=http://127.0.0.1:8765
+    SHARED_STORAGE_URL=redis://127.0.0.1:6380/0   (with --redis-port 6380)
+Run: python benchmarks/fake_upstreams.py [--port 8765] [--redis-port 6380] [--groq-429 0.05] [--yt-latency 40]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+VIDEO_PAGE = 50
+
+
+def channel_id_for(name: str) -> str:
+    """Stable fake channel ID for a handle or search text (what the fake resolves it to)."""
+    return "UC" + hashlib.sha1(name.lower().encode()).hexdigest()[:22]
+
+
+def _seed(value: str) -> int:
+    return int(hashlib.sha1(value.encode()).hexdigest()[:8], 16)
+
+
+class FakeRedis:
+    """Just enough of RESP2/RESP3 for kv.RedisKV through redis-py; keys expire lazily on read."""
+
+    def __init__(self, calls: Counter):
+        self.calls = calls
+        self.data = {}  # key -> (value, expires at or None)
+
+    def _get(self, key: bytes):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, args: list, conn: dict) -> bytes:
+        name = args[0].decode().upper()
+        self.calls[f"redis.{name}"] += 1
+        null = b"_\r\n" if conn["proto"] == 3 else b"$-1\r\n"
+        if name == "HELLO":
+            if len(args) > 1:
+                conn["proto"] = int(args[1])
+            info = [(b"server", b"fake"), (b"version", b"7.0.0"), (b"proto", conn["proto"])]
+            head = b"%%%d\r\n" % len(info) if conn["proto"] == 3 else b"*%d\r\n" % (2 * len(info))
+            return head + b"".join(_bulk(k) + (b":%d\r\n" % v if isinstance(v, int) else _bulk(v))
+                                   for k, v in info)
+        if name == "PING":
+            return b"+PONG\r\n"
+        if name == "GET":
+            return _bulk(self._get(args[1]), null)
+        if name == "MGET":
+            return b"*%d\r\n" % (len(args) - 1) + b"".join(_bulk(self._get(k), null) for k in args[1:])
+        if name == "SET":
+            expires = None
+            options = [a.upper() for a in args[3:]]
+            if b"EX" in options:
+                expires = time.monotonic() + int(args[3 + options.index(b"EX") + 1])
+            elif b"PX" in options:
+                expires = time.monotonic() + int(args[3 + options.index(b"PX") + 1]) / 1000
+            self.data[args[1]] = (args[2], expires)
+            return b"+OK\r\n"
+        if name == "DEL":
+            removed = 0
+            for key in args[1:]:
+                if self._get(key) is not None:
+                    del self.data[key]
+                    removed += 1
+            return b":%d\r\n" % removed
+        if name in ("CLIENT", "SELECT"):  # redis-py's connection setup
+            return b"+OK\r\n"
+        if name == "FLUSHALL":
+            self.data.clear()
+            return b"+OK\r\n"
+        return b"-ERR unknown command '%s'\r\n" % args[0]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        conn = {"proto": 2}  # HELLO 3 (redis-py's default handshake) switches nulls to RESP3
+        try:
+            while True:
+                args = await _read_command(reader)
+                if args is None:
+                    break
+                writer.write(self.execute(args, conn))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def _bulk(value, null: bytes = b"$-1\r\n") -> bytes:
+    return null if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+async def _read_command(reader: asyncio.StreamReader):
+    """One request: a RESP array of bulk strings, or an inline command; None on EOF."""
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()
+    args = []
+    for _ in range(int(line[1:])):
+        size = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+class FakeUpstreams:
+    def __init__(self, yt_latency: float = 0.04, groq_latency: float = 0.3, groq_tps: float = 400,
+                 groq_tokens: int = 200, groq_429: float = 0.0, tg_latency: float = 0.03,
+                 max_videos: int = 500):
+        self.yt_latency = yt_latency
+        self.groq_latency = groq_latency
+        self.groq_tps = groq_tps
+        self.groq_tokens = groq_tokens
+        self.groq_429 = groq_429
+        self.tg_latency = tg_latency
+        self.max_videos = max_videos
+        self.calls = Counter()
+        self.redis = FakeRedis(self.calls)
+        self._message_id = 0
+
+    async def _sleep(self, base: float):
+        # +-25% jitter so concurrent requests do not finish in lockstep
+        if base > 0:
+            await asyncio.sleep(base * random.uniform(0.75, 1.25))
+
+    # --- YouTube ---
+    def _channel(self, channel_id: str) -> dict:
+        seed = _seed(channel_id)
+        return {
+            "id": channel_id,
+            "snippet": {"title": f"Channel {channel_id[-6:]}"},
+            "statistics": {"subscriberCount": str(seed % 5_000_000), "viewCount": str(seed % 900_000_000),
+                           "videoCount": str(self._video_count(channel_id))},
+            "contentDetails": {"relatedPlaylists": {"uploads": "UU" + channel_id[2:]}},
+        }
+
+    def _video_count(self, channel_id: str) -> int:
+        return 1 + _seed(channel_id) % self.max_videos
+
+    async def youtube(self, request):
+        endpoint = request.match_info["endpoint"]
+        q = request.query
+        self.calls[f"youtube.{endpoint}"] += 1
+        await self._sleep(self.yt_latency)
+
+        if endpoint == "channels":
+            if "forHandle" in q:
+                return web.json_response({"items": [{"id": channel_id_for(q["forHandle"].lstrip("@"))}]})
+            if "forUsername" in q:
+                return web.json_response({"items": []})
+            return web.json_response({"items": [self._channel(c) for c in q["id"].split(",")]})
+        if endpoint == "search":
+            return web.json_response({"items": [{"snippet": {"channelId": channel_id_for(q["q"])}}]})
+        if endpoint == "playlistItems":
+            channel_id = "UC" + q["playlistId"][2:]
+            total = self._video_count(channel_id)
+            start = int(q.get("pageToken", 0))
+            end = min(total, start + int(q.get("maxResults", 5)))
+            items = []
+            for n in range(start, end):
+                video_id = hashlib.sha1(f"{channel_id}/{n}".encode()).hexdigest()[:11]
+                published = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - n * 3 * 86400))
+                items.append({
+                    "snippet": {"title": f"Video #{total - n}", "resourceId": {"videoId": video_id},
+                                "publishedAt": published},
+                    "contentDetails": {"videoId": video_id, "videoPublishedAt": published},
+                })
+            data = {"items": items}
+            if end < total:
+                data["nextPageToken"] = str(end)
+            return web.json_response(data)
+        if endpoint == "videos":
+            items = []
+            for video_id in q["id"].split(","):
+                seed = _seed(video_id)
+                items.append({"id": video_id, "snippet": {"channelId": channel_id_for(video_id)},
+                              "statistics": {"viewCount": str(seed % 2_000_000), "likeCount": str(seed % 80_000),
+                                             "commentCount": str(seed % 5_000)}})
+            return web.json_response({"items": items})
+        return web.json_response({"error": {"code": 404, "message": "unknown endpoint"}}, status=404)
+
+    # --- Groq ---
+    async def groq(self, request):
+        body = await request.json()
+        stream = bool(body.get("stream"))
+        self.calls["groq.stream" if stream else "groq.chat"] += 1
+        if random.random() < self.groq_429:
+            self.calls["groq.429"] += 1
+            return web.json_response({"error": {"message": "Rate limit reached"}}, status=429,
+                                     headers={"retry-after": "0.2"})
+
+        await self._sleep(self.groq_latency)
+        tokens = min(self.groq_tokens, body.get("max_tokens", self.groq_tokens))
+        prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": tokens,
+                 "total_tokens": prompt_tokens + tokens}
+        headers = {"x-ratelimit-remaining-requests": "14000", "x-ratelimit-reset-requests": "6s",
+                   "x-ratelimit-remaining-tokens": "50000", "x-ratelimit-reset-tokens": "1s"}
+        words = [f"слово{n % 37}" for n in range(tokens)]
+
+        if not stream:
+            return web.json_response({
+                "choices": [{"message": {"role": "assistant", "content": " ".join(words)}}],
+                "usage": usage,
+            }, headers=headers)
+
+        res = web.StreamResponse(headers={"Content-Type": "text/event-stream", **headers})
+        await res.prepare(request)
+        per_chunk = 8
+        for i in range(0, tokens, per_chunk):
+            delta = " ".join(words[i:i + per_chunk]) + ("\n\n" if i % 64 == 56 else " ")
+            chunk = {"choices": [{"index": 0, "delta": {"content": delta}}]}
+            await res.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            if self.groq_tps:
+                await asyncio.sleep(per_chunk / self.groq_tps)
+        final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "x_groq": {"usage": usage}}
+        await res.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+        await res.write_eof()
+        return res
+
+    # --- Telegram Bot API ---
+    async def telegram(self, request):
+        method = request.match_info["method"]
+        self.calls[f"telegram.{method}"] += 1
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        await self._sleep(self.tg_latency)
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method in ("sendMessage", "editMessageText"):
+            if method == "sendMessage":
+                self._message_id += 1
+                message_id = self._message_id
+            else:
+                message_id = int(params.get("message_id", 0))
+            result = {"message_id": message_id, "date": int(time.time()),
+                      "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                      "text": params.get("text", "")}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    # --- Control ---
+    async def stats(self, request):
+        return web.json_response(dict(self.calls))
+
+    async def reset(self, request):
+        self.calls.clear()
+        return web.json_response({"ok": True})
+
+    def app(self, redis_port: int = 0, host: str = "127.0.0.1") -> web.Application:
+        app = web.Application()
+        if redis_port:
+            async def redis_server(app):
+                server = await asyncio.start_server(self.redis.handle, host, redis_port)
+                yield
+                server.close()
+                await server.wait_closed()
+
+            app.cleanup_ctx.append(redis_server)
+        app.router.add_get("/youtube/v3/{endpoint}", self.youtube)
+        app.router.add_post("/openai/v1/chat/completions", self.groq)
+        app.router.add_post("/bot{token}/{method}", self.telegram)
+        app.router.add_get("/__stats", self.stats)
+        app.router.add_post("/__reset", self.reset)
+        return app
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Latency and fault knobs, shared with bench_bot.py which passes them through."""
+    parser.add_argument("--yt-latency", type=float, default=40, help="YouTube response time, ms")
+    parser.add_argument("--groq-latency", type=float, default=300, help="Groq time to first token, ms")
+    parser.add_argument("--groq-tps", type=float, default=400, help="Groq streaming tokens per second (0 = instant)")
+    parser.add_argument("--groq-tokens", type=int, default=200, help="completion tokens per Groq answer")
+    parser.add_argument("--groq-429", type=float, default=0.0, help="share of Groq calls answered with 429")
+    parser.add_argument("--tg-latency", type=float, default=30, help="Telegram Bot API response time, ms")
+    parser.add_argument("--max-videos", type=int, default=500, help="upper bound of uploads per fake channel")
+
+
+def from_args(args) -> FakeUpstreams:
+    return FakeUpstreams(
+        yt_latency=args.yt_latency / 1000, groq_latency=args.groq_latency / 1000, groq_tps=args.groq_tps,
+        groq_tokens=args.groq_tokens, groq_429=args.groq_429, tg_latency=args.tg_latency / 1000,
+        max_videos=args.max_videos,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--redis-port", type=int, default=0, help="also serve the Redis stand-in here (0 = off)")
+    add_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(from_args(args).app(args.redis_port, args.host), host=args.host, port=args.port, access_log=None,
+                print=lambda *_: print(f"fake upstreams on http://{args.host}:{args.port}", flush=True))
+
+
+if __name__ == "__main__":
+    main()
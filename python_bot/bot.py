@@ -1,220 +1,132 @@
 import os
 import asyncio
+import hashlib
+import html
 import logging
-import aiohttp
+import multiprocessing
+import re
+import signal
+import time
+from datetime import datetime
+from aiohttp import web
 from aiogram import Bot, Dispatcher, Router, F
 from aiogram.filters import CommandStart, Command
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from dotenv import load_dotenv
 
+import services
+import telemetry
+from deep import VideoColumns
+from kv import KVStorage
+from metrics import columns_to_arrays, compute_channel_metrics
+from quota import charged_as, spend_as
+from services import (
+    COMPARE_MAX_CHANNELS, COMPARE_MAX_SEARCHES, DEEP_MAX_VIDEOS, DEEP_REFUSED, GROQ_API_KEY, TOOL_PROMPTS,
+    YouTubeError, build_tips_prompt, channel_id_cache, channel_stats_cache, compare_channels, complete_cached,
+    deep_scan_limit, fetch_channel_stats, fetch_youtube_data, groq_scheduler, http, latest_video_cache, llm_cache,
+    quota, resolver, shared_kv, snapshots, stage_timings, stream_channel_videos, youtube_flight,
+)
+from streaming import TelegramStreamWriter
+
 # Load environment variables
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 OWNER_ID = int(os.getenv("OWNER_ID", "0"))
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+FSM_TTL = float(os.getenv("FSM_TTL", "604800"))
 
 if not BOT_TOKEN:
     raise ValueError("No BOT_TOKEN provided in .env")
 
 # Initialize Bot and Dispatcher
-bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher()
+# Self-hosted Bot API server (or a local stand-in for benchmarks) instead of api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+bot = Bot(
+    token=BOT_TOKEN,
+    default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None,
+)
+dp = Dispatcher(storage=KVStorage(shared_kv, state_ttl=FSM_TTL, data_ttl=FSM_TTL) if shared_kv else MemoryStorage())
 router = Router()
 
 # State definitions
 class AnalyzeState(StatesGroup):
     waiting_for_channel_url = State()
+    waiting_for_channel_list = State()
 
 class ToolState(StatesGroup):
     waiting_for_titles = State()
     waiting_for_hook_topic = State()
     waiting_for_script_idea = State()
 
-# --- Helper Functions for APIs ---
-async def fetch_youtube_data(query: str):
-    """Fetch channel stats and latest video details from YouTube API."""
-    if not YOUTUBE_API_KEY:
-        return None, "YouTube API key is missing in .env"
+# --- Formatting ---
+def _fmt_num(n: int) -> str:
+    for div, suffix in ((1_000_000_000, "B"), (1_000_000, "M"), (1_000, "K")):
+        if n >= div:
+            return f"{n / div:.1f}{suffix}"
+    return str(n)
+
+
+def format_comparison_table(rows: list) -> list:
+    """Render rows as <pre> tables, split into chunks under Telegram's 4096 char limit."""
+    header = f"{'#':>3} {'Канал':<18} {'Подп.':>7} {'Просм.':>7} {'Видео':>6} {'Ср/вид':>7} {'Посл.':>7}"
+    lines = []
+    for i, c in enumerate(rows, 1):
+        name = c["name"] if len(c["name"]) <= 18 else c["name"][:17] + "…"
+        avg = c["views"] // c["videos"] if c["videos"] else 0
+        last = _fmt_num(c["latest"]["views"]) if c.get("latest") else "—"
+        lines.append(
+            f"{i:>3} {html.escape(name):<18} {_fmt_num(c['subs']):>7} {_fmt_num(c['views']):>7} "
+            f"{c['videos']:>6} {_fmt_num(avg):>7} {last:>7}"
+        )
 
-    async with aiohttp.ClientSession() as session:
-        # 1. Resolve channel ID
-        channel_id = None
-        
-        # Basic validation
-        if not query:
-            return None, "Пустой запрос. Пожалуйста, отправьте ссылку или @username."
-            
-        try:
-            if query.startswith("UC") and len(query) >= 24:
-                channel_id = query
-            else:
-                # Try to search or parse handle
-                handle_parts = query.replace("https://www.youtube.com/", "").replace("https://youtube.com/", "").replace("@", "").split("/")
-                handle = handle_parts[0] if handle_parts else query
-                
-                search_url = f"https://www.googleapis.com/youtube/v3/search?part=snippet&type=channel&q={handle}&key={YOUTUBE_API_KEY}"
-                async with session.get(search_url) as res:
-                    if res.status != 200:
-                         return None, f"Ошибка YouTube API: Код {res.status}"
-                    data = await res.json()
-                    if "items" in data and len(data["items"]) > 0:
-                        channel_id = data["items"][0]["snippet"]["channelId"]
-
-            if not channel_id:
-                return None, "Не удалось найти канал по этому запросу. Проверьте правильность ссылки или @username."
-        except Exception as e:
-            logging.error(f"Error resolving channel ID: {e}")
-            return None, "Произошла ошибка при поиске канала."
-
-        # 2. Get Channel Stats
-        try:
-            channel_url = f"https://www.googleapis.com/youtube/v3/channels?part=statistics,snippet,contentDetails&id={channel_id}&key={YOUTUBE_API_KEY}"
-            async with session.get(channel_url) as res:
-                if res.status != 200:
-                    return None, f"Ошибка YouTube API: Код {res.status}"
-                channel_data = await res.json()
-                if not channel_data.get("items"):
-                    return None, "Не удалось получить статистику канала (данные отсутствуют)."
-                
-                info = channel_data["items"][0]
-                stats = info.get("statistics", {})
-                snippet = info.get("snippet", {})
-                content_details = info.get("contentDetails", {})
-                
-                related_playlists = content_details.get("relatedPlaylists", {})
-                uploads_playlist_id = related_playlists.get("uploads")
-
-                channel_name = snippet.get("title", "Unknown")
-                subs = int(stats.get("subscriberCount", 0))
-                views = int(stats.get("viewCount", 0))
-                videos = int(stats.get("videoCount", 0))
-        except Exception as e:
-            logging.error(f"Error fetching channel stats: {e}")
-            return None, "Произошла ошибка при получении статистики канала."
-
-        # 3. Get Latest Video
-        latest_video = None
-        if uploads_playlist_id:
-            try:
-                playlist_url = f"https://www.googleapis.com/youtube/v3/playlistItems?part=snippet&playlistId={uploads_playlist_id}&maxResults=1&key={YOUTUBE_API_KEY}"
-                async with session.get(playlist_url) as res:
-                    pl_data = await res.json()
-                    if "items" in pl_data and len(pl_data["items"]) > 0:
-                        vid_id = pl_data["items"][0]["snippet"]["resourceId"]["videoId"]
-                        vid_title = pl_data["items"][0]["snippet"]["title"]
-                        
-                        # Get stats for this specific video
-                        vid_url = f"https://www.googleapis.com/youtube/v3/videos?part=statistics&id={vid_id}&key={YOUTUBE_API_KEY}"
-                        async with session.get(vid_url) as v_res:
-                            v_data = await v_res.json()
-                            if "items" in v_data and len(v_data["items"]) > 0:
-                                v_stats = v_data["items"][0]["statistics"]
-                                vid_views = int(v_stats.get("viewCount", 0))
-                                vid_likes = int(v_stats.get("likeCount", 0))
-                                latest_video = {
-                                    "title": vid_title,
-                                    "views": vid_views,
-                                    "likes": vid_likes,
-                                    "url": f"https://youtu.be/{vid_id}"
-                                }
-            except Exception as e:
-                logging.error(f"Error fetching latest video: {e}")
-                # We do not fail the whole request just because the latest video failed
-                pass
-
-        return {
-            "name": channel_name,
-            "subs": subs,
-            "views": views,
-            "videos": videos,
-            "latest": latest_video
-        }, None
-
-
-async def generate_groq_tips(channel_info):
-    """Generate tips using Groq Llama3 based on the real channel stats."""
+    chunks, current = [], [header]
+    for line in lines:
+        if sum(len(l) + 1 for l in current) + len(line) > 3800:
+            chunks.append(current)
+            current = [header]
+        current.append(line)
+    chunks.append(current)
+    return ["<pre>" + "\n".join(chunk) + "</pre>" for chunk in chunks]
+
+
+# --- Groq Streaming ---
+async def stream_groq_to_message(msg: Message, header: str, prompt: str, system_prompt: str = "",
+                                 max_tokens: int = 2048, reply_markup=None, lane: str = "long",
+                                 tool: str = None, use_cache: bool = True) -> str:
+    """Stream a Groq completion into ``msg`` with throttled progressive edits.
+
+    Cache handling is ``services.complete_cached``'s: with ``tool`` set the answer
+    is looked up in and stored to the LLM cache, and ``use_cache=False`` (the
+    "regenerate" button) skips the lookup. With streaming off it arrives in one edit.
+    """
     if not GROQ_API_KEY:
-        return "Groq API key is missing. Add it to .env to generate AI strategies."
-
-    prompt = (
-        f"You are an elite YouTube growth expert. Analyze this channel briefly:\n"
-        f"Channel: {channel_info['name']}\n"
-        f"Subscribers: {channel_info['subs']}\n"
-        f"Total Views: {channel_info['views']}\n"
-        f"Videos given: {channel_info['videos']}\n"
-    )
-    if channel_info.get("latest"):
-        latest = channel_info["latest"]
-        prompt += f"Latest video: '{latest['title']}' with {latest['views']} views.\n"
-    
-    prompt += (
-        "\nProvide 3 highly specific, actionable tips in Russian to grow this specific channel right now. "
-        "Use formatting (bold, emojis) to make it easy to read in Telegram."
-    )
+        await msg.edit_text(f"{header}Groq API key is missing in .env.", reply_markup=reply_markup)
+        return ""
 
-    async with aiohttp.ClientSession() as session:
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "model": "llama-3.3-70b-versatile",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.7,
-            "max_tokens": 1024
-        }
-        try:
-            async with session.post("https://api.groq.com/openai/v1/chat/completions", headers=headers, json=payload) as res:
-                if not res.ok:
-                    data = await res.json()
-                    return f"❌ Ошибка Groq API: {data.get('error', {}).get('message', res.status)}"
-                data = await res.json()
-                return data["choices"][0]["message"]["content"]
-        except Exception as e:
-            return f"❌ Ошибка соединения с Groq: {e}"
-
-async def _groq_generic_call(prompt: str, system_prompt: str = "") -> str:
-    if not GROQ_API_KEY:
-        return "Groq API key is missing in .env."
-
-    messages = []
-    if system_prompt:
-        messages.append({"role": "system", "content": system_prompt})
-    messages.append({"role": "user", "content": prompt})
-
-    async with aiohttp.ClientSession() as session:
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "model": "llama-3.3-70b-versatile",
-            "messages": messages,
-            "temperature": 0.7,
-            "max_tokens": 2048
-        }
-        try:
-            async with session.post("https://api.groq.com/openai/v1/chat/completions", headers=headers, json=payload) as res:
-                if not res.ok:
-                    data = await res.json()
-                    return f"❌ Ошибка Groq API: {data.get('error', {}).get('message', res.status)}"
-                data = await res.json()
-                return data["choices"][0]["message"]["content"]
-        except Exception as e:
-            return f"❌ Ошибка соединения с Groq: {e}"
+    writer = TelegramStreamWriter(msg, header=header, interval=STREAM_EDIT_INTERVAL)
+    _, _, err = await complete_cached(tool, prompt, system_prompt, max_tokens, lane=lane, use_cache=use_cache,
+                                      on_delta=writer.feed)
+    footer = f"\n\n{html.escape(err)}" if err else ""
+    return await writer.finish(footer=footer, reply_markup=reply_markup)
 
 # --- Keyboards ---
 WEBAPP_URL = "https://alisafamajidov53-glitch.github.io/channel-analytics/"
 
 def get_main_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📊 Анализ канала", callback_data="action_analyze_channel")],
+        [InlineKeyboardButton(text="📊 Анализ канала", callback_data="action_analyze_channel"),
+         InlineKeyboardButton(text="📋 Сравнение каналов", callback_data="action_compare_channels")],
         [InlineKeyboardButton(text="⚖️ A/B Тест Названий", callback_data="action_tool_titles"),
          InlineKeyboardButton(text="🪝 Вирусные Хуки", callback_data="action_tool_hooks")],
         [InlineKeyboardButton(text="🎬 Генератор Сценариев Pro", callback_data="action_tool_script")],
@@ -276,6 +188,16 @@ async def callback_analyze_channel(callback: CallbackQuery, state: FSMContext):
     )
     await state.set_state(AnalyzeState.waiting_for_channel_url)
 
+@router.callback_query(F.data == "action_compare_channels")
+async def callback_compare_channels(callback: CallbackQuery, state: FSMContext):
+    await callback.message.edit_text(
+        "📋 <b>Сравнение каналов</b>\n\n"
+        "Отправьте список каналов одним сообщением — ссылки или @username, "
+        f"каждый с новой строки или через запятую (до {COMPARE_MAX_CHANNELS} штук).",
+        reply_markup=get_cancel_keyboard()
+    )
+    await state.set_state(AnalyzeState.waiting_for_channel_list)
+
 # --- Tool Callbacks ---
 @router.callback_query(F.data == "action_tool_titles")
 async def cb_tool_titles(callback: CallbackQuery, state: FSMContext):
@@ -319,7 +241,8 @@ async def process_channel_url(message: Message, state: FSMContext):
     thinking_msg = await message.answer("⏳ <i>Подключаюсь к YouTube API...</i>")
     
     # 1. Fetch Real YouTube Data
-    stats, error = await fetch_youtube_data(query)
+    with spend_as("tips" if intent == "action_ai_tips_prompt" else "analyze"):
+        stats, error = await fetch_youtube_data(query)
     
     if error:
         await thinking_msg.edit_text(f"❌ <b>Ошибка:</b> {error}", reply_markup=get_back_keyboard())
@@ -328,128 +251,496 @@ async def process_channel_url(message: Message, state: FSMContext):
     # 2. Proceed based on intent
     if intent == "action_analyze_channel":
         response_text = (
-            f"📊 <b>Реальная аналитика канала:</b> {stats['name']}\n\n"
+            f"📊 <b>Реальная аналитика канала:</b> {html.escape(stats['name'])}\n\n"
             f"👥 <b>Подписчики:</b> {stats['subs']:,}\n"
             f"👁 <b>Просмотры:</b> {stats['views']:,}\n"
             f"🎬 <b>Всего видео:</b> {stats['videos']:,}\n\n"
         )
+
+        # Growth since the last snapshot older than a day, straight from local history
+        prev = await snapshots.snapshot_before(stats["id"], before=time.time() - 86400)
+        if prev:
+            since = datetime.fromtimestamp(prev["ts"]).strftime("%d.%m.%Y")
+            response_text += (
+                f"📈 <b>Рост с {since}:</b> "
+                f"{stats['subs'] - prev['subs']:+,} подписчиков, "
+                f"{stats['views'] - prev['views']:+,} просмотров\n\n"
+            )
         
         if stats["latest"]:
             lv = stats["latest"]
             eng_rate = (lv["likes"] / lv["views"] * 100) if lv["views"] > 0 else 0
             response_text += (
                 f"🔥 <b>Последний релиз:</b>\n"
-                f"<i>Название:</i> {lv['title']}\n"
+                f"<i>Название:</i> {html.escape(lv['title'])}\n"
                 f"<i>Просмотры:</i> {lv['views']:,}\n"
                 f"<i>Лайки:</i> {lv['likes']:,} (Удержание/Вовлеченность ~{eng_rate:.1f}%)\n"
                 f"🔗 {lv['url']}\n"
             )
             
         kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🧠 Получить AI Стратегию (Groq)", callback_data=f"ai_gen_{query}")],
+            [InlineKeyboardButton(text="🧠 Получить AI Стратегию (Groq)", callback_data=f"ai_gen_{stats['id']}")],
+            [InlineKeyboardButton(text="🔬 Глубокий анализ всех видео", callback_data=f"deep_{stats['id']}")],
             [InlineKeyboardButton(text="⬅️ Назад", callback_data="action_main_menu")]
         ])
         
-        # Save query so they can click tips from this menu
-        await state.update_data(last_query=query, last_stats=stats)
+        # Save the stats so the tips button can reuse them
+        await state.update_data(last_stats=stats)
         await thinking_msg.edit_text(response_text, reply_markup=kb, disable_web_page_preview=True)
 
     elif intent == "action_ai_tips_prompt":
         await thinking_msg.edit_text("⏳ <i>YouTube данные получены. Генерирую стратегию через Groq...</i>")
-        ai_tips = await generate_groq_tips(stats)
-        await thinking_msg.edit_text(f"🤖 <b>AI Стратегия для {stats['name']}</b>\n\n{ai_tips}", reply_markup=get_back_keyboard())
+        await stream_groq_to_message(
+            thinking_msg, f"🤖 <b>AI Стратегия для {html.escape(stats['name'])}</b>\n\n",
+            build_tips_prompt(stats), max_tokens=1024, reply_markup=get_back_keyboard(), lane="short", tool="tips"
+        )
+
+
+# --- Deep Analysis ---
+DEEP_EDIT_INTERVAL = float(os.getenv("DEEP_EDIT_INTERVAL", "2"))
+
+
+async def _safe_edit(msg: Message, text: str, fallback: bool = False, **kwargs):
+    """edit_text that ignores rejected edits, e.g. "message is not modified".
+
+    With ``fallback`` (final results) a rejected edit is replaced by a new
+    plain-text message, so the user is never left looking at a progress line.
+    """
+    try:
+        await msg.edit_text(text, **kwargs)
+    except TelegramBadRequest as e:
+        if not fallback or "message is not modified" in str(e):
+            logging.debug(f"Skipped message edit: {e}")
+            return
+        logging.warning(f"Message edit rejected, sending plain text instead: {e}")
+        plain = html.unescape(re.sub(r"<[^>]+>", "", text))
+        await msg.answer(plain, parse_mode=None, **kwargs)
+
+
+def format_deep_summary(channel: dict, m: dict, done: bool) -> str:
+    header = f"🔬 <b>Глубокий анализ:</b> {html.escape(channel['name'])}\n\n"
+    if not m.get("count"):
+        return header + "⏳ <i>Загружаю историю загрузок канала...</i>"
+    progress = "✅ Готово" if done else f"⏳ <i>Обработано {m['count']:,} из ~{channel['videos']:,} видео...</i>"
+    text = header + (
+        f"🎬 <b>Видео в выборке:</b> {m['count']:,}\n"
+        f"👁 <b>Медиана просмотров:</b> {m['median_views']:,.0f} (p90 {m['p90_views']:,.0f}, макс. {m['max_views']:,})\n"
+        f"📆 <b>Просмотров в день (медиана):</b> {m['median_views_per_day']:,.1f}\n"
+        f"💬 <b>Вовлеченность:</b> медиана {m['engagement_p50']:.2f}% "
+        f"(p10 {m['engagement_p10']:.2f}% — p90 {m['engagement_p90']:.2f}%)\n"
+        f"📅 <b>Частота загрузок:</b> {m['uploads_per_week']:.1f} видео/нед, "
+        f"последнее {m['days_since_upload']:.0f} дн. назад\n"
+        f"🚀 <b>Выбросы:</b> {m['outliers_over']} вирусных, {m['outliers_under']} провальных\n"
+        f"🕒 <b>Лучшее время публикации:</b> {m['best_weekday']} {m['best_hour_utc']:02d}:00 UTC\n"
+    )
+    if m.get("trend_pct") is not None:
+        text += f"📈 <b>Тренд:</b> последние 10 видео {m['trend_pct']:+.0f}% к предыдущим 10\n"
+    return text + f"\n{progress}"
+
+
+def _metrics(cols: VideoColumns) -> dict:
+    return compute_channel_metrics(*columns_to_arrays(cols), now=time.time())
+
+
+@router.callback_query(F.data.startswith("deep_"))
+@charged_as("deep")
+async def callback_deep_analysis(callback: CallbackQuery, state: FSMContext):
+    channel_id = callback.data.split("deep_")[1]
+    await callback.answer()
+    max_videos = deep_scan_limit()
+    if not max_videos:
+        await callback.message.answer(DEEP_REFUSED, reply_markup=get_back_keyboard())
+        return
+    progress_msg = await callback.message.answer("⏳ <i>Загружаю историю загрузок канала...</i>")
+
+    try:
+        channel = await fetch_channel_stats(channel_id)
+    except YouTubeError as e:
+        await progress_msg.edit_text(f"❌ <b>Ошибка:</b> {e}", reply_markup=get_back_keyboard())
+        return
+    except Exception as e:
+        logging.error(f"Error loading channel {channel_id} for deep analysis: {e}")
+        await progress_msg.edit_text("❌ <b>Ошибка:</b> не удалось получить данные канала.",
+                                     reply_markup=get_back_keyboard())
+        return
+
+    cols = VideoColumns()
+    last_edit = 0.0
+    error = None
+    try:
+        # Stream pages and push a partial summary as soon as the first page lands
+        async for rows in stream_channel_videos(channel, max_videos):
+            cols.extend(rows)
+            if time.monotonic() - last_edit >= DEEP_EDIT_INTERVAL:
+                last_edit = time.monotonic()
+                await _safe_edit(progress_msg, format_deep_summary(channel, _metrics(cols), done=False))
+    except YouTubeError as e:
+        error = str(e)
+    except Exception as e:
+        logging.error(f"Error during deep analysis of {channel_id}: {e}")
+        error = "Произошла ошибка при загрузке истории видео."
+
+    metrics = _metrics(cols)
+    text = format_deep_summary(channel, metrics, done=True)
+    if error:
+        text += f"\n⚠️ <b>Анализ неполный:</b> {error}"
+    elif max_videos < DEEP_MAX_VIDEOS and channel["videos"] > max_videos:
+        text += f"\nℹ️ <i>Ради экономии квоты YouTube API проанализированы последние {max_videos:,} видео.</i>"
+
+    # Keep a compact copy so the AI strategy can use the full history
+    metrics.pop("heatmap", None)
+    await state.update_data(deep_metrics={"id": channel_id, **metrics})
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🧠 AI Стратегия по истории канала", callback_data=f"ai_gen_{channel_id}")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="action_main_menu")]
+    ])
+    await _safe_edit(progress_msg, text, fallback=True, reply_markup=kb)
+
+
+@router.message(AnalyzeState.waiting_for_channel_list)
+@charged_as("compare")
+async def process_channel_list(message: Message, state: FSMContext):
+    await state.clear()
+    # Only newlines, commas and semicolons separate entries: "Linus Tech Tips" is one channel
+    queries = [q.strip() for q in re.split(r"[\n,;]+", message.text or "") if q.strip()]
+    queries = list(dict.fromkeys(queries))[:COMPARE_MAX_CHANNELS]
+    if not queries:
+        await message.answer("❌ <b>Ошибка:</b> список каналов пуст.", reply_markup=get_back_keyboard())
+        return
+    if not quota:
+        await message.answer("❌ <b>Ошибка:</b> YouTube API key is missing in .env", reply_markup=get_back_keyboard())
+        return
+
+    thinking_msg = await message.answer(f"⏳ <i>Сравниваю {len(queries)} каналов...</i>")
+    try:
+        rows, failed = await compare_channels(queries)
+    except YouTubeError as e:
+        await thinking_msg.edit_text(f"❌ <b>Ошибка:</b> {e}", reply_markup=get_back_keyboard())
+        return
+    except Exception as e:
+        logging.error(f"Error comparing channels: {e}")
+        await thinking_msg.edit_text("❌ <b>Ошибка:</b> не удалось получить данные каналов.", reply_markup=get_back_keyboard())
+        return
+
+    if not rows:
+        await thinking_msg.edit_text("❌ <b>Ошибка:</b> ни один канал не найден.", reply_markup=get_back_keyboard())
+        return
+
+    tables = format_comparison_table(rows)
+    footer = ""
+    if failed:
+        footer = "\n⚠️ <b>Не найдены:</b> " + ", ".join(html.escape(q) for q in failed[:20])
+        if len(failed) > 20:
+            footer += f" и ещё {len(failed) - 20}"
+        footer += (f"\n<i>По названию ищутся не больше {COMPARE_MAX_SEARCHES} каналов из списка — "
+                   "для остальных пришлите ссылку или @handle.</i>")
+    await thinking_msg.edit_text(f"📋 <b>Сравнение {len(rows)} каналов</b>\n\n{tables[0]}")
+    for table in tables[1:]:
+        await message.answer(table)
+    await message.answer(f"✅ Готово.{footer}", reply_markup=get_back_keyboard())
+
+
+@router.message(Command("compare"))
+async def cmd_compare(message: Message, state: FSMContext):
+    await message.answer(
+        "📋 <b>Сравнение каналов</b>\n\n"
+        "Отправьте список каналов одним сообщением — ссылки или @username, "
+        f"каждый с новой строки или через запятую (до {COMPARE_MAX_CHANNELS} штук).",
+        reply_markup=get_cancel_keyboard()
+    )
+    await state.set_state(AnalyzeState.waiting_for_channel_list)
 
 
 @router.callback_query(F.data.startswith("ai_gen_"))
+@charged_as("tips")
 async def callback_quick_ai_gen(callback: CallbackQuery, state: FSMContext):
-    query = callback.data.split("ai_gen_")[1]
+    # Channel IDs keep callback_data within Telegram's 64 bytes, whatever the user typed
+    channel_id = callback.data.split("ai_gen_")[1]
     await callback.message.edit_text("⏳ <i>Генерирую персональную AI-стратегию через Groq API...</i>")
-    
-    stats, err = await fetch_youtube_data(query)
+
+    # Reuse the stats process_channel_url just fetched instead of hitting YouTube again
+    user_data = await state.get_data()
+    last_stats = user_data.get("last_stats")
+    if last_stats and last_stats.get("id") == channel_id:
+        stats, err = last_stats, None
+    else:
+        stats, err = await fetch_youtube_data(channel_id)
     if err:
         await callback.message.edit_text(f"❌ Ошибка YouTube API при генерации: {err}", reply_markup=get_back_keyboard())
         return
+
+    deep_metrics = user_data.get("deep_metrics")
+    if deep_metrics and deep_metrics.get("id") == stats.get("id"):
+        stats = {**stats, "metrics": deep_metrics}
         
-    ai_tips = await generate_groq_tips(stats)
-    await callback.message.edit_text(f"🤖 <b>AI Стратегия для {stats['name']}</b>\n\n{ai_tips}", reply_markup=get_back_keyboard())
+    await stream_groq_to_message(
+        callback.message, f"🤖 <b>AI Стратегия для {html.escape(stats['name'])}</b>\n\n",
+        build_tips_prompt(stats), max_tokens=1024, reply_markup=get_back_keyboard(), lane="short", tool="tips"
+    )
+
+# --- Service Commands ---
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    if OWNER_ID and message.from_user.id != OWNER_ID:
+        return
+    pool = http.snapshot()
+    text = (
+        "🛠 <b>Статистика бота</b>\n\n"
+        f"🌐 <b>HTTP пул:</b> {pool['requests']} запросов, "
+        f"{pool['connections_created']} новых соединений, "
+        f"{pool['connections_reused']} переиспользовано "
+        f"({pool['reuse_ratio'] * 100:.0f}%)\n"
+        f"🧭 <b>DNS кэш:</b> {pool['dns_cache_hits']} попаданий / {pool['dns_cache_misses']} промахов\n"
+    )
+    for cache in (channel_id_cache, channel_stats_cache, latest_video_cache):
+        c = cache.snapshot()
+        text += (
+            f"🗄 <b>{cache.name}:</b> {c['size']} записей, hit rate {c['hit_rate'] * 100:.0f}% "
+            f"({c['hits']} hit / {c['stale_hits']} stale / {c['misses']} miss, {c['evictions']} evicted"
+            + (f", L2 {c['l2_hits']} hit / {c['l2_errors']} err" if shared_kv else "") + ")\n"
+        )
+    if shared_kv:
+        kv = shared_kv.snapshot()
+        text += (
+            f"🗃 <b>Общее хранилище ({kv['backend']}):</b> {kv['round_trips']} round trips, "
+            f"{kv['reads']} чтений, {kv['writes']} записей, {kv['deletes']} удалений\n"
+        )
+    flight = youtube_flight.snapshot()
+    text += (
+        f"🔀 <b>Coalescing:</b> {flight['coalesced']} из {flight['calls']} запросов объединено, "
+        f"{flight['inflight']} в полёте\n"
+    )
+    res = resolver.snapshot()
+    text += (
+        f"🧭 <b>Резолвер:</b> индекс {res['index_hits']}, handle {res['handle']}, "
+        f"username {res['username']}, video {res['video']}, search {res['search']} "
+        f"(отказано {res['search_refused']}, в индексе {res['indexed']})\n"
+    )
+    q = quota.snapshot()
+    text += (
+        f"🎫 <b>Квота YouTube:</b> {q['used']:,} / {q['limit']:,} units, режим {q['level']} "
+        f"(подробно: /quota)\n"
+    )
+    db = snapshots.snapshot()
+    text += (
+        f"💾 <b>Снапшоты:</b> {db['writes']} записей в {db['batches']} батчах, "
+        f"{db['read_hits']}/{db['reads']} чтений с диска, {db['pending']} в очереди\n"
+    )
+    groq = groq_scheduler.snapshot()
+    for lane, g in groq["lanes"].items():
+        text += (
+            f"🤖 <b>Groq {lane}:</b> в очереди {g['queued']}, активно {g['active']}, "
+            f"ожидание avg {g['wait_avg_ms']:.0f} / max {g['wait_max_ms']:.0f} ms, "
+            f"429: {g['rate_limited']}, ретраев {g['retries']}\n"
+        )
+    llm = llm_cache.snapshot()
+    text += f"🧾 <b>LLM кэш:</b> {llm['entries']} записей, {llm['bytes'] / 1024:.0f} KB, вытеснено {llm['evictions']}\n"
+    for tool, t in llm["tools"].items():
+        text += f"   • {tool}: hit rate {t['hit_rate'] * 100:.0f}% ({t['hits']}/{t['hits'] + t['misses']}), regen {t['bypassed']}\n"
+    for name, t in stage_timings.items():
+        avg = t["total_ms"] / t["count"] if t["count"] else 0
+        text += f"⏱ <b>{name}:</b> avg {avg:.0f} ms, max {t['max_ms']:.0f} ms, таймаутов {t['timeouts']}\n"
+    await message.answer(text)
+
+@router.message(Command("quota"))
+async def cmd_quota(message: Message):
+    if OWNER_ID and message.from_user.id != OWNER_ID:
+        return
+    q = quota.snapshot()
+    hours, minutes = divmod(q["reset_in_s"] // 60, 60)
+    text = (
+        f"🎫 <b>Квота YouTube API за {q['day']}</b>\n\n"
+        f"Израсходовано: {q['used']:,} из {q['limit']:,} units, осталось {q['remaining']:,}\n"
+        f"Режим: <b>{q['level']}</b>, сброс через {hours} ч {minutes} мин (полночь по Pacific)\n"
+        f"Вызовов: {q['calls']}, отказано: {q['refused']}, ключей исчерпано досрочно: {q['exhausted_keys']}\n\n"
+        "<b>Ключи:</b>\n"
+    )
+    for k in q["keys"]:
+        text += f"   • {k['id']} (вес {k['weight']}): {k['used']:,} / {k['limit']:,}\n"
+    text += "<b>По функциям:</b>\n"
+    for feature, units in q["features"].items():
+        text += f"   • {feature}: {units:,}\n"
+    text += "<b>По методам API:</b>\n"
+    for endpoint, units in q["endpoints"].items():
+        text += f"   • {endpoint}: {units:,}\n"
+    await message.answer(text)
 
 # --- Tool Processors ---
+# tool -> (wait text, result header); prompts and lanes live in services.TOOL_PROMPTS
+TOOLS = {
+    "titles": ("⏳ <i>Анализирую психологию и CTR ваших вариантов...</i>", "⚖️ <b>Результаты A/B Теста:</b>\n\n"),
+    "hooks": ("⏳ <i>Пишу сценарии вирусных хуков...</i>", "🪝 <b>Ваши Хуки:</b>\n\n"),
+    "script": ("⏳ <i>Генерирую 'Masterpiece' продакшен план... Это займет около 10 секунд.</i>",
+               "🎬 <b>Генератор Сценариев Pro:</b>\n\n"),
+}
+
+def get_tool_result_keyboard(tool: str):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔄 Сгенерировать заново", callback_data=f"regen_{tool}")],
+        [InlineKeyboardButton(text="⬅️ Назад в меню", callback_data="action_main_menu")]
+    ])
+
+async def _run_tool(tool: str, user_input: str, message: Message, state: FSMContext, use_cache: bool = True):
+    wait_text, header = TOOLS[tool]
+    build_prompt, lane = TOOL_PROMPTS[tool]
+    # Remember the input so "regenerate" can replay it without the cache
+    await state.update_data(last_tool={"tool": tool, "input": user_input})
+    wait_msg = await message.answer(wait_text)
+    await stream_groq_to_message(wait_msg, header, build_prompt(user_input),
+                                 reply_markup=get_tool_result_keyboard(tool), lane=lane,
+                                 tool=tool, use_cache=use_cache)
+
 @router.message(ToolState.waiting_for_titles)
 async def process_titles(message: Message, state: FSMContext):
     titles = message.text.strip()
     await state.clear()
-    wait_msg = await message.answer("⏳ <i>Анализирую психологию и CTR ваших вариантов...</i>")
-    
-    prompt = (
-        "You are a YouTube CTR and psychology expert.\n"
-        "Analyze these titles for a video and determine which will get the highest click-through rate:\n\n"
-        f"{titles}\n\n"
-        "СТРОГОЕ ПРАВИЛО: ОТВЕЧАЙ ИСКЛЮЧИТЕЛЬНО НА РУССКОМ ЯЗЫКЕ.\n\n"
-        "Provide your analysis formatted in Markdown.\n"
-        "1. Declare the WINNER clearly.\n"
-        "2. Give a CTR prediction out of 100 for each.\n"
-        "3. Explain the psychological triggers.\n"
-        "4. Provide ONE new 'God-Tier' title that is even better."
-    )
-    res = await _groq_generic_call(prompt)
-    await wait_msg.edit_text(f"⚖️ <b>Результаты A/B Теста:</b>\n\n{res}", reply_markup=get_back_keyboard())
+    await _run_tool("titles", titles, message, state)
 
 @router.message(ToolState.waiting_for_hook_topic)
 async def process_hooks(message: Message, state: FSMContext):
     topic = message.text.strip()
     await state.clear()
-    wait_msg = await message.answer("⏳ <i>Пишу сценарии вирусных хуков...</i>")
-    
-    prompt = (
-        "You are a high-retention YouTube Shorts and Video scriptwriter.\n"
-        f"Video Topic: \"{topic}\"\n\n"
-        "СТРОГОЕ ПРАВИЛО: ОТВЕЧАЙ ИСКЛЮЧИТЕЛЬНО НА РУССКОМ ЯЗЫКЕ.\n\n"
-        "Generate 3 distinct, high-impact verbal hooks for the first 3-5 seconds of this video.\n"
-        "Format in Markdown:\n"
-        "- **Hook 1 (The Question/Curiosity Gap)**\n"
-        "- **Hook 2 (The Negative Statement/Shock)**\n"
-        "- **Hook 3 (The Ultra-Specific Value Promise)**\n"
-        "Include brief visual direction for each (e.g., [Camera rapidly zooms in])."
-    )
-    res = await _groq_generic_call(prompt)
-    await wait_msg.edit_text(f"🪝 <b>Ваши Хуки:</b>\n\n{res}", reply_markup=get_back_keyboard())
+    await _run_tool("hooks", topic, message, state)
 
 @router.message(ToolState.waiting_for_script_idea)
 async def process_script_idea(message: Message, state: FSMContext):
     idea = message.text.strip()
     await state.clear()
-    wait_msg = await message.answer("⏳ <i>Генерирую 'Masterpiece' продакшен план... Это займет около 10 секунд.</i>")
-    
-    prompt = (
-        "You are a legendary YouTube Producer and Scriptwriter who has helped creators gain millions of views.\n"
-        "I have an idea for a video. You need to turn it into a complete, ready-to-shoot production plan.\n\n"
-        f"Topic / Idea: \"{idea}\"\n\n"
-        "СТРОГОЕ ПРАВИЛО: ОТВЕЧАЙ ИСКЛЮЧИТЕЛЬНО НА РУССКОМ ЯЗЫКЕ (включая сценарии, хуки и инструкции).\n\n"
-        "Create a highly structured production guide in Markdown format. Use emojis and bold text. "
-        "It MUST contain these exact sections:\n"
-        "# 🎬 1. Идея и Угол подачи (Curiosity gap)\n"
-        "# 💥 2. Топ-3 Кликбейтных названия\n"
-        "# 🖼️ 3. Идея Превью (Thumbnail)\n"
-        "# 🪝 4. 5-секундный вирусный хук (Сценарий дословно)\n"
-        "# 📜 5. Структура сценария (3 Акта)\n"
-        "# ⏱️ 6. Точка удержания (Pattern interrupt)\n"
-        "# 📢 7. Призыв к действию (CTA)"
-    )
-    res = await _groq_generic_call(prompt)
-    await wait_msg.edit_text(f"🎬 <b>Генератор Сценариев Pro:</b>\n\n{res}", reply_markup=get_back_keyboard())
+    await _run_tool("script", idea, message, state)
+
+@router.callback_query(F.data.startswith("regen_"))
+async def callback_regenerate(callback: CallbackQuery, state: FSMContext):
+    tool = callback.data.split("regen_")[1]
+    last = (await state.get_data()).get("last_tool")
+    if tool not in TOOLS or not last or last.get("tool") != tool:
+        await callback.answer("⚠️ Нет данных для повторной генерации", show_alert=True)
+        return
+    await callback.answer()
+    await _run_tool(tool, last["input"], callback.message, state, use_cache=False)
 
 
-# Register router
+# Register router (handler latency and sampled traces via telemetry)
+telemetry.instrument(router)
 dp.include_router(router)
 
-async def main():
-    logging.basicConfig(level=logging.INFO)
-    print("Starting Telegram Bot with Real APIs...")
+# --- Runtime ---
+# polling (default, local dev) or webhook (aiohttp app, several workers on one port)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL") or os.getenv("RENDER_EXTERNAL_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Telegram echoes this in X-Telegram-Bot-Api-Secret-Token; derived from the token if unset
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or hashlib.sha256(BOT_TOKEN.encode()).hexdigest()
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("PORT", "8080"))
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+# Polling mode has no web server of its own; set this to expose /metrics and /healthz anyway
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+@dp.startup()
+async def on_startup():
+    await services.start()
+
+@dp.shutdown()
+async def on_shutdown():
+    await services.close()
+
+async def run_polling():
+    runner = None
+    if METRICS_PORT:
+        app = web.Application()
+        app.router.add_get("/healthz", health)
+        app.router.add_get("/metrics", telemetry.metrics_handler)
+        runner = web.AppRunner(app, handle_signals=False)
+        await runner.setup()
+        await web.TCPSite(runner, WEB_HOST, METRICS_PORT).start()
     try:
         await bot.delete_webhook(drop_pending_updates=True)
         await dp.start_polling(bot)
     finally:
-        await bot.session.close()
+        if runner is not None:
+            await runner.cleanup()
+
+async def health(request: web.Request):
+    return web.json_response({"ok": True, "mode": BOT_MODE, "pid": os.getpid()})
+
+async def run_webhook(worker: int = 0):
+    if not WEBHOOK_URL:
+        raise ValueError("BOT_MODE=webhook needs WEBHOOK_URL (public https base URL)")
+
+    app = web.Application()
+    # Updates are acknowledged right away and handled in background tasks
+    SimpleRequestHandler(dp, bot, handle_in_background=True, secret_token=WEBHOOK_SECRET).register(
+        app, path=WEBHOOK_PATH
+    )
+    app.router.add_get("/healthz", health)
+    # With WEB_WORKERS > 1 each scrape reaches one worker; its pid is in the JSON dumps
+    app.router.add_get("/metrics", telemetry.metrics_handler)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    # SO_REUSEPORT lets every worker process bind the same port; the kernel balances connections
+    await web.TCPSite(runner, WEB_HOST, WEB_PORT, reuse_port=WEB_WORKERS > 1).start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        if worker == 0:
+            await bot.set_webhook(
+                WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+        logging.info(f"Webhook worker {worker} (pid {os.getpid()}) listening on {WEB_HOST}:{WEB_PORT}{WEBHOOK_PATH}")
+        await stop.wait()
+    finally:
+        # The webhook stays registered so a rolling deploy keeps receiving updates
+        await runner.cleanup()
+
+def _webhook_worker(worker: int):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_webhook(worker))
+
+def serve_webhook_workers(workers: int):
+    """Fork ``workers`` processes that share one port via SO_REUSEPORT."""
+    if shared_kv is None:
+        # Every flow is "button sets a state, then a message"; with per-process MemoryStorage the
+        # kernel can route the message to a worker that never saw the state and it is dropped
+        logging.error(
+            f"WEB_WORKERS={workers} needs SHARED_STORAGE_URL so workers share FSM state; "
+            "falling back to a single worker"
+        )
+        asyncio.run(run_webhook())
+        return
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_webhook_worker, args=(i,), name=f"webhook-{i}") for i in range(workers)]
+    for p in procs:
+        p.start()
+
+    def forward(signum, frame):
+        for p in procs:
+            if p.is_alive():
+                os.kill(p.pid, signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for p in procs:
+        p.join()
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    print("Starting Telegram Bot with Real APIs...")
+    if BOT_MODE == "webhook":
+        await run_webhook()
+    else:
+        await run_polling()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if BOT_MODE == "webhook" and WEB_WORKERS > 1:
+        logging.basicConfig(level=logging.INFO)
+        serve_webhook_workers(WEB_WORKERS)
+    else:
+        asyncio.run(main())
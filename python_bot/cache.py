@@ -0,0 +1,184 @@
+"""Bounded in-process TTL + LRU cache with stale-while-revalidate.
+
+Entries expire after ``ttl`` seconds. For another ``stale_ttl`` seconds an
+expired entry is still returned immediately while a single background task
+refreshes it. When the cache holds ``max_entries`` items the least recently
+used entry is evicted.
+
+With an ``l2`` store (see ``kv.py``) the cache becomes two-level: L1 misses
+are looked up in the shared store before fetching, and new values are
+written behind to it in batches, so replicas and restarts share entries.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    def __init__(self, name: str, ttl: float, max_entries: int = 1000, stale_ttl: float = 0.0, l2=None):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (value, stored_at)
+        self._refreshing = set()
+        self._tasks = set()
+        self.l2 = l2
+        self._l2_pending = {}  # key -> (value, wall time) waiting for the next write-behind batch
+        self._l2_flush = None
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0, "refreshes": 0,
+                      "l2_hits": 0, "l2_errors": 0}
+
+    def __len__(self):
+        return len(self._data)
+
+    def _lookup(self, key):
+        """Return (value, state) where state is 'fresh', 'stale' or None."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None, None
+        value, stored_at = entry
+        age = time.monotonic() - stored_at
+        if age <= self.ttl:
+            self._data.move_to_end(key)
+            return value, "fresh"
+        if age <= self.ttl + self.stale_ttl:
+            self._data.move_to_end(key)
+            return value, "stale"
+        del self._data[key]
+        return None, None
+
+    def get(self, key, default=None):
+        value, state = self._lookup(key)
+        if state == "fresh":
+            self.stats["hits"] += 1
+            return value
+        self.stats["misses"] += 1
+        return default
+
+    def _store(self, key, value, stored_at: float):
+        self._data[key] = (value, stored_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def set(self, key, value):
+        self._store(key, value, time.monotonic())
+        if self.l2 is not None:
+            self._l2_pending[key] = (value, time.time())
+            if self._l2_flush is None:
+                self._l2_flush = asyncio.create_task(self._flush_l2())
+
+    # --- Shared L2 ---
+    def _l2_key(self, key) -> str:
+        return f"cache:{self.name}:{key}"
+
+    async def _flush_l2(self):
+        # Yield once so every set() from the same burst lands in one pipeline
+        await asyncio.sleep(0)
+        batch, self._l2_pending = self._l2_pending, {}
+        self._l2_flush = None
+        try:
+            await self.l2.set_many(
+                {self._l2_key(k): {"v": v, "t": t} for k, (v, t) in batch.items()},
+                ttl=self.ttl + self.stale_ttl,
+            )
+        except Exception as e:
+            self.stats["l2_errors"] += 1
+            logging.warning(f"L2 write failed for {self.name}: {e}")
+
+    async def flush(self):
+        """Wait for the pending write-behind batch (called on shutdown)."""
+        if self._l2_flush is not None:
+            await self._l2_flush
+
+    def _adopt(self, key, entry) -> bool:
+        """Copy a shared entry into L1, keeping its age so TTL/stale rules still apply."""
+        if not entry:
+            return False
+        age = time.time() - entry["t"]
+        if age > self.ttl + self.stale_ttl:
+            return False
+        self._store(key, entry["v"], time.monotonic() - max(age, 0.0))
+        self.stats["l2_hits"] += 1
+        return True
+
+    async def _l2_get_many(self, keys: list) -> list:
+        try:
+            return await self.l2.get_many([self._l2_key(k) for k in keys])
+        except Exception as e:
+            # A shared-store outage degrades to L1-only, never to a failed request
+            self.stats["l2_errors"] += 1
+            logging.warning(f"L2 read failed for {self.name}: {e}")
+            return [None] * len(keys)
+
+    async def get_many(self, keys: list) -> dict:
+        """Fresh values for ``keys``; L1 misses are read from L2 in one round trip."""
+        found = {}
+        missing = []
+        for key in keys:
+            value, state = self._lookup(key)
+            if state == "fresh":
+                found[key] = value
+            else:
+                missing.append(key)
+        if missing and self.l2 is not None:
+            for key, entry in zip(missing, await self._l2_get_many(missing)):
+                if self._adopt(key, entry):
+                    value, state = self._lookup(key)
+                    if state == "fresh":
+                        found[key] = value
+        self.stats["hits"] += len(found)
+        self.stats["misses"] += len(keys) - len(found)
+        return found
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    async def get_or_fetch(self, key, fetch, refresh: bool = True):
+        """Return the cached value for ``key`` or await ``fetch()`` and store it.
+
+        ``fetch`` is a zero-argument coroutine function. A ``None`` result is
+        returned to the caller but never cached. Stale entries are served
+        as-is while ``fetch`` runs in the background, unless ``refresh`` is
+        False (used to save upstream quota).
+        """
+        value, state = self._lookup(key)
+        if state is None and self.l2 is not None:
+            if self._adopt(key, (await self._l2_get_many([key]))[0]):
+                value, state = self._lookup(key)
+        if state == "fresh":
+            self.stats["hits"] += 1
+            return value
+        if state == "stale":
+            self.stats["stale_hits"] += 1
+            if refresh and key not in self._refreshing:
+                self._refreshing.add(key)
+                task = asyncio.create_task(self._refresh(key, fetch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return value
+
+        self.stats["misses"] += 1
+        value = await fetch()
+        if value is not None:
+            self.set(key, value)
+        return value
+
+    async def _refresh(self, key, fetch):
+        try:
+            value = await fetch()
+            if value is not None:
+                self.set(key, value)
+                self.stats["refreshes"] += 1
+        except Exception as e:
+            logging.warning(f"Background refresh failed for {self.name}:{key}: {e}")
+        finally:
+            self._refreshing.discard(key)
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["stale_hits"] + self.stats["misses"]
+        hit_rate = (self.stats["hits"] + self.stats["stale_hits"]) / lookups if lookups else 0.0
+        return {**self.stats, "size": len(self._data), "hit_rate": round(hit_rate, 3)}
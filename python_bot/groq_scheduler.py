@@ -0,0 +1,176 @@
+"""Rate-limit-aware scheduler in front of every Groq request.
+
+Jobs wait in two priority lanes: ``short`` (A/B titles, hooks, tips) is
+always served before ``long`` (2048-token script generations), and the long
+lane may never take every slot, so a burst of scripts cannot starve quick
+answers. A token bucket is kept in sync with Groq's ``x-ratelimit-*``
+response headers, and 429 responses are retried with jittered exponential
+backoff that honours ``retry-after``. Queue depth and wait times are
+exposed through ``snapshot()``.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import re
+import time
+from contextlib import asynccontextmanager
+
+LANES = {"short": 0, "long": 1}
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float = 0.0, message: str = "rate limited"):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_duration(value) -> float:
+    """Parse Groq reset durations such as "2m59.56s", "7.66s" or "120ms" into seconds."""
+    if value is None:
+        return 0.0
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    return sum(float(n) * _UNITS[unit] for n, unit in _DURATION_RE.findall(value))
+
+
+class GroqScheduler:
+    def __init__(self, concurrency: int = 4, max_retries: int = 4,
+                 base_backoff: float = 1.0, max_backoff: float = 30.0):
+        self.concurrency = concurrency
+        # Long jobs leave at least one slot free for the short lane
+        self.long_limit = max(1, concurrency - 1)
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._waiters = []
+        self._seq = itertools.count()
+        self._active = {lane: 0 for lane in LANES}
+
+        # Token bucket state mirrored from x-ratelimit-* headers
+        self.remaining_requests = None
+        self.requests_reset_at = 0.0
+        self.remaining_tokens = None
+        self.tokens_reset_at = 0.0
+        self.blocked_until = 0.0
+
+        self.stats = {
+            lane: {"queued": 0, "started": 0, "wait_total_ms": 0.0, "wait_max_ms": 0.0,
+                   "retries": 0, "rate_limited": 0, "failed": 0}
+            for lane in LANES
+        }
+
+    # --- Slot management ---
+    def _dispatch(self):
+        while self._waiters and sum(self._active.values()) < self.concurrency:
+            _, _, lane, future = self._waiters[0]
+            if future.cancelled():
+                heapq.heappop(self._waiters)
+                continue
+            if lane == "long" and self._active["long"] >= self.long_limit:
+                # Only long jobs are left in the heap; they wait for a long slot
+                break
+            heapq.heappop(self._waiters)
+            self._active[lane] += 1
+            future.set_result(None)
+
+    def _release(self, lane: str):
+        self._active[lane] -= 1
+        self._dispatch()
+
+    async def _wait_for_budget(self, cost: int):
+        while True:
+            now = time.monotonic()
+            wait = self.blocked_until - now
+            if self.remaining_requests is not None and self.remaining_requests <= 0:
+                wait = max(wait, self.requests_reset_at - now)
+            if self.remaining_tokens is not None and self.remaining_tokens < cost:
+                wait = max(wait, self.tokens_reset_at - now)
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+            # The window has reset; trust the next response headers again
+            if time.monotonic() >= self.requests_reset_at:
+                self.remaining_requests = None
+            if time.monotonic() >= self.tokens_reset_at:
+                self.remaining_tokens = None
+        if self.remaining_requests is not None:
+            self.remaining_requests -= 1
+        if self.remaining_tokens is not None:
+            self.remaining_tokens -= cost
+
+    @asynccontextmanager
+    async def slot(self, lane: str, cost: int = 0):
+        """Hold one concurrency slot in ``lane`` once the rate-limit budget allows."""
+        stats = self.stats[lane]
+        enqueued = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (LANES[lane], next(self._seq), lane, future))
+        stats["queued"] += 1
+        try:
+            self._dispatch()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self._release(lane)
+                raise
+        finally:
+            stats["queued"] -= 1
+
+        try:
+            await self._wait_for_budget(cost)
+            waited = (time.monotonic() - enqueued) * 1000
+            stats["started"] += 1
+            stats["wait_total_ms"] += waited
+            stats["wait_max_ms"] = max(stats["wait_max_ms"], waited)
+            yield
+        finally:
+            self._release(lane)
+
+    # --- Retries ---
+    def backoff(self, attempt: int, retry_after: float = 0.0) -> float:
+        delay = min(self.max_backoff, self.base_backoff * (2 ** attempt)) * random.uniform(0.5, 1.5)
+        return max(delay, retry_after)
+
+    async def run(self, lane: str, fn, cost: int = 0):
+        """Run ``fn()`` in ``lane``, retrying RateLimited with jittered backoff."""
+        for attempt in range(self.max_retries + 1):
+            async with self.slot(lane, cost):
+                try:
+                    return await fn()
+                except RateLimited as e:
+                    self.stats[lane]["rate_limited"] += 1
+                    if attempt == self.max_retries:
+                        self.stats[lane]["failed"] += 1
+                        raise
+                    delay = self.backoff(attempt, e.retry_after)
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + e.retry_after)
+            self.stats[lane]["retries"] += 1
+            await asyncio.sleep(delay)
+
+    # --- Header feedback ---
+    def update_from_headers(self, headers):
+        now = time.monotonic()
+        if "x-ratelimit-remaining-requests" in headers:
+            self.remaining_requests = int(headers["x-ratelimit-remaining-requests"])
+            self.requests_reset_at = now + parse_duration(headers.get("x-ratelimit-reset-requests"))
+        if "x-ratelimit-remaining-tokens" in headers:
+            self.remaining_tokens = int(headers["x-ratelimit-remaining-tokens"])
+            self.tokens_reset_at = now + parse_duration(headers.get("x-ratelimit-reset-tokens"))
+
+    def snapshot(self) -> dict:
+        lanes = {}
+        for lane, s in self.stats.items():
+            avg = s["wait_total_ms"] / s["started"] if s["started"] else 0.0
+            lanes[lane] = {**s, "active": self._active[lane], "wait_avg_ms": round(avg, 1)}
+        return {
+            "lanes": lanes,
+            "remaining_requests": self.remaining_requests,
+            "remaining_tokens": self.remaining_tokens,
+        }
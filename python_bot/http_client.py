@@ -0,0 +1,90 @@
+"""Shared, pooled aiohttp client used for every YouTube and Groq call.
+
+One ClientSession lives for the whole bot process: created in ``main()`` and
+closed on shutdown. Connections to googleapis.com and api.groq.com are kept
+alive and reused, DNS lookups are cached, and reuse is counted through an
+aiohttp TraceConfig so we can check that the pool is actually being hit.
+"""
+import aiohttp
+
+
+class HttpClient:
+    def __init__(self, limit: int = 100, limit_per_host: int = 20,
+                 keepalive_timeout: float = 60.0, dns_ttl: int = 300,
+                 total_timeout: float = 30.0, connect_timeout: float = 10.0,
+                 read_timeout: float = 30.0):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        self.timeout = aiohttp.ClientTimeout(
+            total=total_timeout, connect=connect_timeout, sock_read=read_timeout
+        )
+        self._session = None
+        self.stats = {
+            "requests": 0,
+            "connections_created": 0,
+            "connections_reused": 0,
+            "dns_cache_hits": 0,
+            "dns_cache_misses": 0,
+        }
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            self.stats["requests"] += 1
+
+        async def on_connection_create_end(session, ctx, params):
+            self.stats["connections_created"] += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self.stats["connections_reused"] += 1
+
+        async def on_dns_cache_hit(session, ctx, params):
+            self.stats["dns_cache_hits"] += 1
+
+        async def on_dns_cache_miss(session, ctx, params):
+            self.stats["dns_cache_misses"] += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace
+
+    async def start(self):
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_ttl,
+            use_dns_cache=True,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            trace_configs=[self._trace_config()],
+        )
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            raise RuntimeError("HttpClient is not started; call await http.start() first")
+        return self._session
+
+    def reuse_ratio(self) -> float:
+        opened = self.stats["connections_created"] + self.stats["connections_reused"]
+        return self.stats["connections_reused"] / opened if opened else 0.0
+
+    def snapshot(self) -> dict:
+        """Current counters plus the connection reuse ratio."""
+        return {**self.stats, "reuse_ratio": round(self.reuse_ratio(), 3)}
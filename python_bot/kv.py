@@ -0,0 +1,220 @@
+"""Shared key-value storage for FSM state and cache entries.
+
+``RedisKV`` speaks the Redis protocol (Redis, Valkey, KeyDB, or any local
+stand-in) and sends every multi-key call as a single pipelined round trip.
+``FileKV`` keeps the same data in a local SQLite file for single-host
+deployments. Both store compact JSON with per-key TTLs, so several bot
+replicas can share conversations and cache entries, and both survive
+restarts. ``KVStorage`` plugs either backend into aiogram's FSM.
+"""
+import asyncio
+import json
+import math
+import sqlite3
+import threading
+import time
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+
+try:
+    from redis import asyncio as aioredis
+except ImportError:  # optional: only needed for redis:// URLs
+    aioredis = None
+
+
+def dumps(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(raw):
+    return json.loads(raw) if raw is not None else None
+
+
+class KVStore:
+    """Async API shared by the backends; subclasses implement the batch calls."""
+
+    def __init__(self):
+        self.stats = {"reads": 0, "writes": 0, "deletes": 0, "round_trips": 0, "errors": 0}
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def get_many(self, keys: list) -> list:
+        raise NotImplementedError
+
+    async def set_many(self, items: dict, ttl: float = None):
+        raise NotImplementedError
+
+    async def delete(self, keys: list):
+        raise NotImplementedError
+
+    async def get(self, key: str):
+        return (await self.get_many([key]))[0]
+
+    async def set(self, key: str, value, ttl: float = None):
+        await self.set_many({key: value}, ttl)
+
+    def snapshot(self) -> dict:
+        return {"backend": type(self).__name__, **self.stats}
+
+
+class RedisKV(KVStore):
+    def __init__(self, url: str, prefix: str = "ca:"):
+        if aioredis is None:
+            raise RuntimeError("redis:// storage needs the 'redis' package (pip install redis)")
+        super().__init__()
+        self.url = url
+        self.prefix = prefix
+        self._redis = None
+
+    async def start(self):
+        self._redis = aioredis.from_url(self.url)
+        await self._redis.ping()
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def get_many(self, keys: list) -> list:
+        if not keys:
+            return []
+        self.stats["round_trips"] += 1
+        self.stats["reads"] += len(keys)
+        raw = await self._redis.mget([self.prefix + k for k in keys])
+        return [loads(r) for r in raw]
+
+    async def set_many(self, items: dict, ttl: float = None):
+        if not items:
+            return
+        ex = math.ceil(ttl) if ttl else None
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(self.prefix + key, dumps(value), ex=ex)
+            self.stats["round_trips"] += 1
+            self.stats["writes"] += len(items)
+            await pipe.execute()
+
+    async def delete(self, keys: list):
+        if not keys:
+            return
+        self.stats["round_trips"] += 1
+        self.stats["deletes"] += len(keys)
+        await self._redis.delete(*(self.prefix + k for k in keys))
+
+
+class FileKV(KVStore):
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        # WAL lets several worker processes on one host share the file
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)")
+        conn.execute("DELETE FROM kv WHERE expires < ?", (time.time(),))
+        self._conn = conn
+
+    async def start(self):
+        await asyncio.to_thread(self._open)
+
+    async def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _get_many(self, keys: list) -> list:
+        marks = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._conn.execute(f"SELECT key, value, expires FROM kv WHERE key IN ({marks})", keys).fetchall()
+        now = time.time()
+        found = {key: value for key, value, expires in rows if expires is None or expires >= now}
+        return [loads(found.get(k)) for k in keys]
+
+    def _set_many(self, items: dict, ttl: float):
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                [(key, dumps(value), expires) for key, value in items.items()],
+            )
+            self._conn.execute("COMMIT")
+
+    def _delete(self, keys: list):
+        with self._lock:
+            self._conn.executemany("DELETE FROM kv WHERE key = ?", [(k,) for k in keys])
+
+    async def get_many(self, keys: list) -> list:
+        if not keys:
+            return []
+        self.stats["round_trips"] += 1
+        self.stats["reads"] += len(keys)
+        return await asyncio.to_thread(self._get_many, list(keys))
+
+    async def set_many(self, items: dict, ttl: float = None):
+        if not items:
+            return
+        self.stats["round_trips"] += 1
+        self.stats["writes"] += len(items)
+        await asyncio.to_thread(self._set_many, items, ttl)
+
+    async def delete(self, keys: list):
+        if not keys:
+            return
+        self.stats["round_trips"] += 1
+        self.stats["deletes"] += len(keys)
+        await asyncio.to_thread(self._delete, list(keys))
+
+
+def create_kv(url: str):
+    """``redis://``/``rediss://``/``unix://`` -> RedisKV, ``sqlite:///path`` -> FileKV, empty -> None."""
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisKV(url)
+    if url.startswith("sqlite:///"):
+        return FileKV(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported shared storage URL: {url}")
+
+
+class KVStorage(BaseStorage):
+    """aiogram FSM storage on top of a KVStore; the owner closes the store."""
+
+    def __init__(self, kv: KVStore, state_ttl: float = None, data_ttl: float = None):
+        self.kv = kv
+        self.key_builder = DefaultKeyBuilder(prefix="fsm", with_destiny=True)
+        self.state_ttl = state_ttl
+        self.data_ttl = data_ttl
+
+    async def set_state(self, key, state=None):
+        storage_key = self.key_builder.build(key, "state")
+        if state is None:
+            await self.kv.delete([storage_key])
+        else:
+            await self.kv.set(storage_key, state.state if isinstance(state, State) else state, self.state_ttl)
+
+    async def get_state(self, key):
+        return await self.kv.get(self.key_builder.build(key, "state"))
+
+    async def set_data(self, key, data):
+        storage_key = self.key_builder.build(key, "data")
+        if not data:
+            await self.kv.delete([storage_key])
+        else:
+            await self.kv.set(storage_key, dict(data), self.data_ttl)
+
+    async def get_data(self, key):
+        return await self.kv.get(self.key_builder.build(key, "data")) or {}
+
+    async def close(self):
+        pass
@@ -0,0 +1,193 @@
+"""Content-addressed cache for Groq tool outputs.
+
+Keys are a SHA-256 over (model, system prompt, normalized user prompt,
+temperature, max_tokens), so identical or whitespace-only different
+submissions reuse one completion. Entries expire after a TTL and the store
+is bounded by both entry count and total bytes (least recently used first).
+The backing store is pluggable: ``MemoryBackend`` or ``SQLiteBackend`` for
+persistence across restarts.
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_prompt(text: str) -> str:
+    return " ".join(text.split())
+
+
+def cache_key(model: str, system_prompt: str, prompt: str, temperature: float, max_tokens: int) -> str:
+    raw = json.dumps(
+        [model, normalize_prompt(system_prompt), normalize_prompt(prompt), temperature, max_tokens],
+        ensure_ascii=False, separators=(",", ":"),
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    def __init__(self, max_entries: int = 2000, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self.evictions = 0
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def get(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at, size = entry
+        if expires_at < time.time():
+            del self._data[key]
+            self._bytes -= size
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: float):
+        size = len(value.encode("utf-8"))
+        if key in self._data:
+            self._bytes -= self._data.pop(key)[2]
+        self._data[key] = (value, time.time() + ttl, size)
+        self._bytes += size
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, _, old_size) = self._data.popitem(last=False)
+            self._bytes -= old_size
+            self.evictions += 1
+
+    def size(self) -> dict:
+        return {"entries": len(self._data), "bytes": self._bytes}
+
+
+class SQLiteBackend:
+    def __init__(self, path: str, max_entries: int = 2000, max_bytes: int = 16 * 1024 * 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._conn = None
+        self._lock = threading.Lock()
+        self._entries = 0
+        self._bytes = 0
+        self.evictions = 0
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache (last_access)")
+        conn.execute("DELETE FROM llm_cache WHERE expires < ?", (time.time(),))
+        self._entries, self._bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()
+        self._conn = conn
+
+    async def start(self):
+        await asyncio.to_thread(self._open)
+
+    async def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if row[1] < now:
+                self._delete(key)
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def _delete(self, key: str):
+        row = self._conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row:
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._entries -= 1
+            self._bytes -= row[0]
+
+    def _set(self, key: str, value: str, ttl: float):
+        size = len(value.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._delete(key)
+            self._conn.execute(
+                "INSERT INTO llm_cache (key, value, size, expires, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now + ttl, now),
+            )
+            self._entries += 1
+            self._bytes += size
+            while self._entries > self.max_entries or self._bytes > self.max_bytes:
+                oldest = self._conn.execute(
+                    "SELECT key FROM llm_cache ORDER BY last_access LIMIT 1"
+                ).fetchone()
+                if oldest is None:
+                    break
+                self._delete(oldest[0])
+                self.evictions += 1
+
+    async def get(self, key: str):
+        if self._conn is None:
+            return None
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str, ttl: float):
+        if self._conn is None:
+            return
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    def size(self) -> dict:
+        return {"entries": self._entries, "bytes": self._bytes}
+
+
+class LLMCache:
+    def __init__(self, backend, ttl: float = 86400):
+        self.backend = backend
+        self.ttl = ttl
+        self.stats = {}
+
+    def _tool_stats(self, tool: str) -> dict:
+        return self.stats.setdefault(tool, {"hits": 0, "misses": 0, "bypassed": 0, "stored": 0})
+
+    async def start(self):
+        await self.backend.start()
+
+    async def close(self):
+        await self.backend.close()
+
+    async def get(self, tool: str, key: str):
+        value = await self.backend.get(key)
+        self._tool_stats(tool)["hits" if value is not None else "misses"] += 1
+        return value
+
+    def bypass(self, tool: str):
+        """Count a "regenerate" request that skipped the cache on purpose."""
+        self._tool_stats(tool)["bypassed"] += 1
+
+    async def set(self, tool: str, key: str, value: str):
+        await self.backend.set(key, value, self.ttl)
+        self._tool_stats(tool)["stored"] += 1
+
+    def snapshot(self) -> dict:
+        tools = {}
+        for tool, s in self.stats.items():
+            lookups = s["hits"] + s["misses"]
+            tools[tool] = {**s, "hit_rate": round(s["hits"] / lookups, 3) if lookups else 0.0}
+        return {"tools": tools, "evictions": self.backend.evictions, **self.backend.size()}
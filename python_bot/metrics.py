@@ -0,0 +1,123 @@
+"""Vectorized channel metrics over per-video history (NumPy).
+
+Takes the columnar arrays collected by ``deep.VideoColumns`` and computes
+everything in a handful of vectorized passes: view distribution,
+views-per-day normalization, robust outlier detection, rolling averages,
+engagement-rate percentiles and a weekday x hour upload heatmap.
+The returned dict holds plain Python numbers so it can go straight into the
+Telegram report, the Groq prompt or FSM storage.
+"""
+import numpy as np
+
+WEEKDAYS_RU = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+OUTLIER_Z = 3.5
+ROLLING_WINDOW = 10
+
+
+def columns_to_arrays(cols):
+    """Zero-copy NumPy views over a VideoColumns instance."""
+    return (
+        np.frombuffer(cols.views, dtype=np.int64),
+        np.frombuffer(cols.likes, dtype=np.int64),
+        np.frombuffer(cols.comments, dtype=np.int64),
+        np.frombuffer(cols.published, dtype=np.float64),
+    )
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over ``window`` items via a cumulative sum (O(n))."""
+    if len(values) < window:
+        return np.empty(0)
+    csum = np.cumsum(np.insert(values.astype(np.float64), 0, 0.0))
+    return (csum[window:] - csum[:-window]) / window
+
+
+def compute_channel_metrics(views, likes, comments, published, now: float) -> dict:
+    n = len(views)
+    if n == 0:
+        return {"count": 0}
+
+    views = np.asarray(views, dtype=np.float64)
+    interactions = np.asarray(likes, dtype=np.float64) + np.asarray(comments, dtype=np.float64)
+    published = np.asarray(published, dtype=np.float64)
+
+    # Views-per-day puts old and new videos on the same scale
+    age_days = np.maximum((now - published) / 86400.0, 1.0)
+    vpd = views / age_days
+
+    # Robust z-score on log views/day (median + MAD survives viral spikes)
+    log_vpd = np.log1p(vpd)
+    med = np.median(log_vpd)
+    mad = np.median(np.abs(log_vpd - med))
+    z = 0.6745 * (log_vpd - med) / mad if mad > 0 else np.zeros(n)
+    over = np.flatnonzero(z > OUTLIER_Z)
+    under = np.flatnonzero(z < -OUTLIER_Z)
+
+    # Engagement rate per video, ignoring videos with hidden or zero views
+    has_views = views > 0
+    engagement = interactions[has_views] / views[has_views] * 100
+    eng_p10, eng_p50, eng_p90 = (np.percentile(engagement, [10, 50, 90]) if engagement.size else (0.0, 0.0, 0.0))
+
+    # Chronological order for rolling averages and cadence
+    order = np.argsort(published)
+    rolling = rolling_mean(views[order], ROLLING_WINDOW)
+    recent_avg = float(rolling[-1]) if rolling.size else float(views.mean())
+    prev_avg = float(rolling[-1 - ROLLING_WINDOW]) if rolling.size > ROLLING_WINDOW else None
+    trend = (recent_avg / prev_avg - 1) * 100 if prev_avg else None
+
+    span_weeks = max((published.max() - published.min()) / (7 * 86400), 1 / 7)
+
+    # Upload heatmap (UTC): 1970-01-01 was a Thursday, so Monday = 0 needs +3
+    days = np.floor(published / 86400).astype(np.int64)
+    slot = ((days + 3) % 7) * 24 + ((published % 86400) // 3600).astype(np.int64)
+    heatmap = np.bincount(slot, minlength=168)
+    slot_views = np.bincount(slot, weights=vpd, minlength=168)
+    # Only trust slots with a few uploads; fall back to the busiest slot
+    eligible = heatmap >= max(3, n // 100)
+    slot_avg = np.divide(slot_views, heatmap, out=np.zeros(168), where=heatmap > 0)
+    best_slot = int(np.argmax(np.where(eligible, slot_avg, -1))) if eligible.any() else int(np.argmax(heatmap))
+
+    return {
+        "count": n,
+        "total_views": int(views.sum()),
+        "mean_views": float(views.mean()),
+        "median_views": float(np.median(views)),
+        "p90_views": float(np.percentile(views, 90)),
+        "max_views": int(views.max()),
+        "median_views_per_day": float(np.median(vpd)),
+        "engagement": float(interactions.sum() / views.sum() * 100) if views.sum() else 0.0,
+        "engagement_p10": float(eng_p10),
+        "engagement_p50": float(eng_p50),
+        "engagement_p90": float(eng_p90),
+        "outliers_over": int(over.size),
+        "outliers_under": int(under.size),
+        "rolling_avg_views": recent_avg,
+        "trend_pct": float(trend) if trend is not None else None,
+        "uploads_per_week": float(n / span_weeks) if n > 1 else 0.0,
+        "days_since_upload": float((now - published.max()) / 86400),
+        "best_weekday": WEEKDAYS_RU[best_slot // 24],
+        "best_hour_utc": best_slot % 24,
+        "heatmap": heatmap.reshape(7, 24).tolist(),
+    }
+
+
+def metrics_for_prompt(m: dict) -> str:
+    """Compact English fact sheet for the Groq growth-tips prompt."""
+    if not m.get("count"):
+        return ""
+    lines = [
+        f"Videos analysed: {m['count']}",
+        f"Median views per video: {m['median_views']:.0f} (p90 {m['p90_views']:.0f}, max {m['max_views']})",
+        f"Median views per day since upload: {m['median_views_per_day']:.1f}",
+        f"Engagement rate (likes+comments / views): median {m['engagement_p50']:.2f}%, "
+        f"p10 {m['engagement_p10']:.2f}%, p90 {m['engagement_p90']:.2f}%",
+        f"Upload cadence: {m['uploads_per_week']:.1f} videos/week, last upload {m['days_since_upload']:.0f} days ago",
+        f"Viral outliers: {m['outliers_over']} over-performing, {m['outliers_under']} under-performing videos",
+        f"Best upload slot by views/day: {m['best_weekday']} {m['best_hour_utc']:02d}:00 UTC",
+    ]
+    if m.get("trend_pct") is not None:
+        lines.append(
+            f"Last {ROLLING_WINDOW} videos average {m['rolling_avg_views']:.0f} views "
+            f"({m['trend_pct']:+.0f}% vs the {ROLLING_WINDOW} before)"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,281 @@
+"""YouTube Data API quota accounting.
+
+Every call is charged its unit cost (``search.list`` = 100, the other
+endpoints used here = 1) against a per-key daily budget. Like Google's own
+counter, the day resets at midnight Pacific time. Spend is persisted to
+SQLite (additive upserts, so several worker processes on one host share the
+count) and attributed to the feature set with ``spend_as()``. Keys are
+chosen by smooth weighted round-robin among those with budget left, and
+``level()`` tells callers how far to degrade as the budget runs out.
+"""
+import asyncio
+import functools
+import hashlib
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+PACIFIC = ZoneInfo("America/Los_Angeles")
+UNIT_COSTS = {"search": 100}
+DEFAULT_COST = 1
+
+# Degradation levels, in the order they kick in
+NORMAL, SERVE_STALE, SKIP_LATEST, NO_SEARCH = range(4)
+LEVEL_NAMES = ["normal", "serve_stale", "skip_latest", "no_search"]
+
+current_feature = ContextVar("quota_feature", default="other")
+
+
+@contextmanager
+def spend_as(feature: str):
+    """Attribute YouTube quota spent inside this block (and tasks it starts) to ``feature``."""
+    token = current_feature.set(feature)
+    try:
+        yield
+    finally:
+        current_feature.reset(token)
+
+
+def charged_as(feature: str):
+    """Decorator form of ``spend_as`` for whole handlers."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with spend_as(feature):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def unit_cost(endpoint: str) -> int:
+    return UNIT_COSTS.get(endpoint, DEFAULT_COST)
+
+
+def quota_day(now: datetime = None) -> str:
+    return (now or datetime.now(PACIFIC)).astimezone(PACIFIC).date().isoformat()
+
+
+def seconds_until_reset(now: datetime = None) -> float:
+    now = (now or datetime.now(PACIFIC)).astimezone(PACIFIC)
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=PACIFIC)
+    return (midnight - now).total_seconds()
+
+
+def parse_keys(spec: str) -> list:
+    """``"KEY1:3,KEY2"`` -> [("KEY1", 3), ("KEY2", 1)]."""
+    keys = []
+    for part in (spec or "").split(","):
+        key, _, weight = part.strip().partition(":")
+        if key:
+            keys.append((key, max(1, int(weight or 1))))
+    return keys
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, reset_in: float):
+        super().__init__("daily YouTube quota exhausted")
+        self.reset_in = reset_in
+
+
+class ApiKey:
+    __slots__ = ("key", "id", "weight", "limit", "used", "current")
+
+    def __init__(self, key: str, weight: int, limit: int):
+        self.key = key
+        # Only a fingerprint of the key is ever stored or shown
+        self.id = hashlib.sha256(key.encode()).hexdigest()[:8]
+        self.weight = weight
+        self.limit = limit
+        self.used = 0
+        self.current = 0
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.limit - self.used)
+
+
+class QuotaManager:
+    def __init__(self, keys: list, daily_limit: int = 10000, path: str = "quota.db",
+                 thresholds=(0.70, 0.85, 0.95), flush_interval: float = 2.0):
+        self.keys = [ApiKey(key, weight, daily_limit) for key, weight in keys]
+        self.path = path
+        self.thresholds = thresholds  # used fraction at which SERVE_STALE / SKIP_LATEST / NO_SEARCH start
+        self.flush_interval = flush_interval
+        self.day = quota_day()
+        self.features = {}   # feature -> units today
+        self.endpoints = {}  # endpoint -> units today
+        self.stats = {"calls": 0, "refused": 0, "exhausted_keys": 0}
+        self._pending = {}   # (day, key_id, feature, endpoint) -> units not yet flushed
+        self._conn = None
+        self._lock = threading.Lock()
+        self._task = None
+        self._closing = False
+        self._wake = asyncio.Event()
+
+    def __bool__(self):
+        return bool(self.keys)
+
+    # --- Persistence ---
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS quota_usage (day TEXT NOT NULL, key_id TEXT NOT NULL, "
+            "feature TEXT NOT NULL, endpoint TEXT NOT NULL, units INTEGER NOT NULL, "
+            "PRIMARY KEY (day, key_id, feature, endpoint))"
+        )
+        self._conn = conn
+
+    def _write_and_reload(self, day: str, pending: dict):
+        """Add pending deltas (each under the day it was spent), then read back ``day``'s totals."""
+        with self._lock:
+            if pending:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT INTO quota_usage (day, key_id, feature, endpoint, units) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (day, key_id, feature, endpoint) DO UPDATE SET units = units + excluded.units",
+                    [(d, k, f, e, units) for (d, k, f, e), units in pending.items()],
+                )
+                self._conn.execute("COMMIT")
+            return self._conn.execute(
+                "SELECT key_id, feature, endpoint, units FROM quota_usage WHERE day = ?", (day,)
+            ).fetchall()
+
+    def _apply_totals(self, rows):
+        by_key, features, endpoints = {}, {}, {}
+        for key_id, feature, endpoint, units in rows:
+            by_key[key_id] = by_key.get(key_id, 0) + units
+            features[feature] = features.get(feature, 0) + units
+            endpoints[endpoint] = endpoints.get(endpoint, 0) + units
+        # Spend charged since the flush started is still only in _pending
+        for (day, key_id, feature, endpoint), units in self._pending.items():
+            if day != self.day:
+                continue
+            by_key[key_id] = by_key.get(key_id, 0) + units
+            features[feature] = features.get(feature, 0) + units
+            endpoints[endpoint] = endpoints.get(endpoint, 0) + units
+        for key in self.keys:
+            # Never lower a key we saw exhausted upstream
+            key.used = max(by_key.get(key.id, 0), key.used if key.used >= key.limit else 0)
+        self.features, self.endpoints = features, endpoints
+
+    async def _sync(self):
+        day = self.day
+        pending, self._pending = self._pending, {}
+        try:
+            rows = await asyncio.to_thread(self._write_and_reload, day, pending)
+        except Exception as e:
+            logging.error(f"Quota flush failed: {e}")
+            for k, units in pending.items():
+                self._pending[k] = self._pending.get(k, 0) + units
+            return
+        if day == self.day:
+            self._apply_totals(rows)
+
+    async def _writer(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self._sync()
+
+    async def start(self):
+        await asyncio.to_thread(self._open)
+        await self._sync()
+        self._task = asyncio.create_task(self._writer())
+
+    async def close(self):
+        if self._task is not None:
+            self._closing = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        if self._conn is not None:
+            await self._sync()
+            self._conn.close()
+            self._conn = None
+
+    # --- Accounting ---
+    def _roll_day(self):
+        today = quota_day()
+        if today != self.day:
+            logging.info(f"YouTube quota day {self.day} closed: {self.used()} units")
+            self.day = today
+            self.features, self.endpoints = {}, {}
+            for key in self.keys:
+                key.used = 0
+            # Yesterday's unflushed spend stays keyed by its own day; write it out now
+            self._wake.set()
+
+    def used(self) -> int:
+        return sum(k.used for k in self.keys)
+
+    def limit(self) -> int:
+        return sum(k.limit for k in self.keys)
+
+    def level(self) -> int:
+        """Current degradation level from the share of today's budget already spent."""
+        self._roll_day()
+        if not self.keys:
+            return NORMAL
+        spent = self.used() / self.limit()
+        level = NORMAL
+        for i, threshold in enumerate(self.thresholds, start=1):
+            if spent >= threshold:
+                level = i
+        return level
+
+    def acquire(self, endpoint: str) -> ApiKey:
+        """Pick a key for one call and charge its cost; raises QuotaExceeded when none can pay."""
+        self._roll_day()
+        cost = unit_cost(endpoint)
+        best, total = None, 0
+        for key in self.keys:
+            if key.remaining < cost:
+                continue
+            key.current += key.weight
+            total += key.weight
+            if best is None or key.current > best.current:
+                best = key
+        if best is None:
+            self.stats["refused"] += 1
+            raise QuotaExceeded(seconds_until_reset())
+        best.current -= total
+
+        best.used += cost
+        feature = current_feature.get()
+        self.features[feature] = self.features.get(feature, 0) + cost
+        self.endpoints[endpoint] = self.endpoints.get(endpoint, 0) + cost
+        slot = (self.day, best.id, feature, endpoint)
+        self._pending[slot] = self._pending.get(slot, 0) + cost
+        self.stats["calls"] += 1
+        return best
+
+    def mark_exhausted(self, key: ApiKey):
+        """YouTube said quotaExceeded: trust it over our own count until the reset."""
+        if key.used < key.limit:
+            key.used = key.limit
+            self.stats["exhausted_keys"] += 1
+            self._wake.set()
+
+    def snapshot(self) -> dict:
+        level = self.level()
+        return {
+            "day": self.day,
+            "used": self.used(),
+            "limit": self.limit(),
+            "remaining": self.limit() - self.used(),
+            "level": LEVEL_NAMES[level],
+            "reset_in_s": round(seconds_until_reset()),
+            "keys": [{"id": k.id, "weight": k.weight, "used": k.used, "limit": k.limit} for k in self.keys],
+            "features": dict(sorted(self.features.items(), key=lambda kv: -kv[1])),
+            "endpoints": dict(self.endpoints),
+            **self.stats,
+        }
@@ -0,0 +1,250 @@
+"""Channel resolution: turn a link, @handle or video URL into a channel ID.
+
+The URL form is parsed first and resolved with the cheap 1-unit lookups
+(``channels?forHandle=``, ``channels?forUsername=``, ``videos?id=``).
+The 100-unit ``search.list`` call is used only as a last resort. Every
+successful resolution is remembered in a persistent handle -> ID index.
+"""
+import re
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from urllib.parse import urlparse, parse_qs
+
+CHANNEL_ID_RE = re.compile(r"^UC[\w-]{22}$")
+VIDEO_ID_RE = re.compile(r"^[\w-]{11}$")
+HANDLE_RE = re.compile(r"^[\w.\-·]{3,30}$")
+# Handles, /user/ names and custom URLs match regardless of case; video and channel IDs do not
+CASE_INSENSITIVE_KINDS = ("handle", "username", "custom")
+
+
+
+class SearchBudget:
+    """How many ``search.list`` fallbacks one request may still make (shared by the tasks it starts)."""
+
+    def __init__(self, searches: int):
+        self.left = searches
+
+    def take(self) -> bool:
+        if self.left <= 0:
+            return False
+        self.left -= 1
+        return True
+
+
+# None = no per-request limit; the public JSON API sets SearchBudget(0), bulk compare a small one
+search_budget = ContextVar("resolver_search_budget", default=None)
+
+
+def parse_channel_input(query: str):
+    """Classify user input as ("id" | "handle" | "username" | "custom" | "video" | "search", value)."""
+    q = query.strip()
+    if CHANNEL_ID_RE.match(q):
+        return "id", q
+    if q.startswith("@"):
+        return "handle", q[1:].split("/")[0].split("?")[0]
+
+    url = q if "://" in q else f"https://{q}"
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    parts = [p for p in parsed.path.split("/") if p]
+
+    if host == "youtu.be" and parts:
+        return "video", parts[0]
+    if host == "youtube.com" or host.endswith(".youtube.com"):
+        if not parts:
+            return "search", q
+        head = parts[0]
+        if head.startswith("@"):
+            return "handle", head[1:]
+        if head == "channel" and len(parts) > 1 and CHANNEL_ID_RE.match(parts[1]):
+            return "id", parts[1]
+        if head == "c" and len(parts) > 1:
+            return "custom", parts[1]
+        if head == "user" and len(parts) > 1:
+            return "username", parts[1]
+        if head == "watch":
+            video_id = parse_qs(parsed.query).get("v", [""])[0]
+            if video_id:
+                return "video", video_id
+        if head in ("shorts", "live", "embed") and len(parts) > 1:
+            return "video", parts[1]
+        # Legacy vanity URL: youtube.com/<name>
+        return "custom", head
+
+    # Bare word like "MrBeast": try it as a handle before searching
+    if HANDLE_RE.match(q):
+        return "handle", q
+    return "search", q
+
+
+class ChannelIndex:
+    """In-memory (kind, value) -> channel ID mapping with write-through persistence.
+
+    Exact lookups (handle, username, video) are kept indefinitely. Mappings
+    that came from ``search.list`` are keyed on whatever free text users type,
+    so they are bounded: at most ``search_max`` entries in LRU order, each
+    expiring ``search_ttl`` seconds after it was resolved.
+
+    ``persist(key, channel_id, ts)`` is called for every new mapping (``ts`` is
+    None for exact ones) and with ``channel_id=None`` when a search mapping is
+    evicted. ``load()`` seeds the index from what the persistence layer kept.
+    """
+
+    def __init__(self, persist=None, search_max: int = 5000, search_ttl: float = 7 * 86400):
+        self.persist = persist
+        self.search_max = search_max
+        self.search_ttl = search_ttl
+        self._data = {}
+        self._searched = OrderedDict()  # key -> (channel_id, resolved_at), least recently used first
+        self.evictions = 0
+
+    @staticmethod
+    def _key(kind: str, value: str) -> str:
+        return f"{kind}:{value.lower() if kind in CASE_INSENSITIVE_KINDS else value}"
+
+    def load(self, data: dict):
+        """Seed from ``{key: (channel_id, ts)}``; ``ts`` is None for exact mappings."""
+        for key, (channel_id, ts) in sorted(data.items(), key=lambda kv: kv[1][1] or 0):
+            if ts is None:
+                self._data[key] = channel_id
+            else:
+                self._searched[key] = (channel_id, ts)
+        cutoff = time.time() - self.search_ttl
+        for key in [k for k, (_, ts) in self._searched.items() if ts < cutoff]:
+            self._evict(key)
+        self._trim()
+
+    def get(self, kind: str, value: str):
+        key = self._key(kind, value)
+        channel_id = self._data.get(key)
+        if channel_id is not None:
+            return channel_id
+        entry = self._searched.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[1] > self.search_ttl:
+            self._evict(key)
+            return None
+        self._searched.move_to_end(key)
+        return entry[0]
+
+    async def put(self, kind: str, value: str, channel_id: str, searched: bool = False):
+        key = self._key(kind, value)
+        if not searched:
+            if self._data.get(key) == channel_id:
+                return
+            self._data[key] = channel_id
+            self._searched.pop(key, None)
+            if self.persist is not None:
+                self.persist(key, channel_id, None)
+            return
+        if key in self._data:
+            return
+        ts = time.time()
+        self._searched[key] = (channel_id, ts)
+        self._searched.move_to_end(key)
+        if self.persist is not None:
+            self.persist(key, channel_id, ts)
+        # Expiry is checked lazily on get; the size cap keeps unread entries bounded
+        self._trim()
+
+    def _evict(self, key: str):
+        del self._searched[key]
+        self.evictions += 1
+        if self.persist is not None:
+            self.persist(key, None, None)
+
+    def _trim(self):
+        while len(self._searched) > self.search_max:
+            self._evict(next(iter(self._searched)))
+
+    def __len__(self):
+        return len(self._data) + len(self._searched)
+
+
+class SearchRefused(Exception):
+    """The input needs ``search.list`` but ``can_search()`` currently says no."""
+
+
+class ChannelResolver:
+    def __init__(self, yt_get, index: ChannelIndex, can_search=None):
+        """``yt_get(endpoint, **params)`` performs one YouTube Data API GET.
+
+        ``can_search()`` gates the 100-unit fallback; when it returns False,
+        inputs that only search could resolve raise SearchRefused.
+        """
+        self.yt_get = yt_get
+        self.index = index
+        self.can_search = can_search
+        self.stats = {"index_hits": 0, "handle": 0, "username": 0, "video": 0, "search": 0,
+                      "search_refused": 0, "not_found": 0}
+
+    async def resolve(self, query: str):
+        """Return the channel ID for ``query`` or None if nothing matches."""
+        kind, value = parse_channel_input(query)
+        if kind == "id":
+            return value
+
+        channel_id = self.index.get(kind, value)
+        if channel_id:
+            self.stats["index_hits"] += 1
+            return channel_id
+
+        if kind == "handle":
+            channel_id = await self._by_handle(value)
+        elif kind == "username":
+            channel_id = await self._by_username(value) or await self._by_handle(value)
+        elif kind == "custom":
+            # Most legacy custom URLs were migrated to an identical handle
+            channel_id = await self._by_handle(value) or await self._by_username(value)
+        elif kind == "video":
+            channel_id = await self._by_video(value)
+
+        searched = False
+        if not channel_id and kind != "video":
+            channel_id = await self._by_search(value)
+            searched = True
+
+        if not channel_id:
+            self.stats["not_found"] += 1
+            return None
+        await self.index.put(kind, value, channel_id, searched=searched)
+        return channel_id
+
+    async def _by_handle(self, handle: str):
+        data = await self.yt_get("channels", part="id", forHandle=f"@{handle}")
+        if data.get("items"):
+            self.stats["handle"] += 1
+            return data["items"][0]["id"]
+        return None
+
+    async def _by_username(self, username: str):
+        data = await self.yt_get("channels", part="id", forUsername=username)
+        if data.get("items"):
+            self.stats["username"] += 1
+            return data["items"][0]["id"]
+        return None
+
+    async def _by_video(self, video_id: str):
+        if not VIDEO_ID_RE.match(video_id):
+            return None
+        data = await self.yt_get("videos", part="snippet", id=video_id)
+        if data.get("items"):
+            self.stats["video"] += 1
+            return data["items"][0]["snippet"]["channelId"]
+        return None
+
+    async def _by_search(self, text: str):
+        budget = search_budget.get()
+        if (self.can_search is not None and not self.can_search()) or (budget is not None and not budget.take()):
+            self.stats["search_refused"] += 1
+            raise SearchRefused(text)
+        data = await self.yt_get("search", part="snippet", type="channel", q=text, maxResults=1)
+        if data.get("items"):
+            self.stats["search"] += 1
+            return data["items"][0]["snippet"]["channelId"]
+        return None
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "indexed": len(self.index), "index_evictions": self.index.evictions}
@@ -0,0 +1,789 @@
+"""YouTube and Groq fetch layer shared by the Telegram bot and the web API.
+
+Owns the pooled HTTP client, the caches (with optional shared L2), the
+SQLite snapshot history, request coalescing, the Groq scheduler and the
+LLM answer cache. Importing it needs no BOT_TOKEN; call ``start()`` once
+inside the event loop before use and ``close()`` on shutdown.
+"""
+import os
+import asyncio
+import logging
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+
+import telemetry
+from cache import TTLCache
+from deep import PAGE_SIZE as DEEP_PAGE_SIZE, stream_video_stats
+from groq_scheduler import GroqScheduler, RateLimited, parse_duration
+from http_client import HttpClient
+from kv import create_kv
+from llm_cache import LLMCache, MemoryBackend, SQLiteBackend, cache_key
+from metrics import metrics_for_prompt
+from quota import NO_SEARCH, SERVE_STALE, SKIP_LATEST, QuotaExceeded, QuotaManager, parse_keys
+from resolver import (
+    CASE_INSENSITIVE_KINDS, ChannelIndex, ChannelResolver, SearchBudget, SearchRefused, parse_channel_input,
+    search_budget,
+)
+from singleflight import SingleFlight
+from storage import SnapshotStore
+from streaming import iter_sse_content
+
+load_dotenv()
+
+# Default location of the bot's SQLite files, independent of the working directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+
+# Daily YouTube quota per key ("KEY1:3,KEY2:1" = weighted rotation), reset at Pacific midnight.
+# Past each threshold the bot degrades: stale cache only -> no latest-video lookup -> no search.
+quota = QuotaManager(
+    parse_keys(os.getenv("YOUTUBE_API_KEYS") or YOUTUBE_API_KEY or ""),
+    daily_limit=int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000")),
+    path=os.getenv("QUOTA_DB_PATH", os.path.join(BASE_DIR, "quota.db")),
+    thresholds=(
+        float(os.getenv("QUOTA_STALE_AT", "0.70")),
+        float(os.getenv("QUOTA_SKIP_LATEST_AT", "0.85")),
+        float(os.getenv("QUOTA_NO_SEARCH_AT", "0.95")),
+    ),
+)
+# Under quota pressure, disk snapshots up to this old are good enough
+QUOTA_STALE_MAX_AGE = float(os.getenv("QUOTA_STALE_MAX_AGE", "86400"))
+
+# Shared HTTP pool for YouTube and Groq (opened in start(), closed in close())
+http = HttpClient(
+    limit_per_host=int(os.getenv("HTTP_LIMIT_PER_HOST", "20")),
+    keepalive_timeout=float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60")),
+    dns_ttl=int(os.getenv("HTTP_DNS_TTL", "300")),
+    total_timeout=float(os.getenv("HTTP_TOTAL_TIMEOUT", "30")),
+    connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "10")),
+)
+
+# Optional shared store (redis://... or sqlite:///path) for FSM state and as cache L2;
+# unset keeps everything in process memory
+shared_kv = create_kv(os.getenv("SHARED_STORAGE_URL", ""))
+
+# In-process caches: handle->channel_id mappings change rarely, stats go stale fast
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "5000"))
+channel_id_cache = TTLCache("channel_id", ttl=float(os.getenv("CACHE_CHANNEL_ID_TTL", "604800")),
+                            max_entries=CACHE_MAX_ENTRIES, l2=shared_kv)
+channel_stats_cache = TTLCache("channel_stats", ttl=float(os.getenv("CACHE_STATS_TTL", "300")),
+                               max_entries=CACHE_MAX_ENTRIES, stale_ttl=600, l2=shared_kv)
+latest_video_cache = TTLCache("latest_video", ttl=float(os.getenv("CACHE_LATEST_TTL", "600")),
+                              max_entries=CACHE_MAX_ENTRIES, stale_ttl=1200, l2=shared_kv)
+
+# Persistent snapshot history (SQLite, WAL); also backs the caches across restarts
+snapshots = SnapshotStore(os.getenv("SNAPSHOT_DB_PATH", os.path.join(BASE_DIR, "channel_snapshots.db")))
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", "300"))
+
+# Coalesces concurrent identical channel lookups into one upstream call chain
+youtube_flight = SingleFlight("youtube")
+
+
+# --- Helper Functions for APIs ---
+# Base URLs are overridable so local stand-ins (benchmarks/fake_upstreams.py) can replace them
+YT_API = os.getenv("YOUTUBE_API_URL", "https://www.googleapis.com/youtube/v3")
+
+
+class YouTubeError(Exception):
+    """YouTube failure whose message can be shown to the user as-is.
+
+    ``status`` is what the JSON API answers with: 502 for upstream failures,
+    404 when nothing matches, 503 while the quota holds the request back.
+    """
+
+    def __init__(self, message: str, status: int = 502):
+        super().__init__(message)
+        self.status = status
+
+
+def normalize_query(query: str) -> str:
+    """Canonical cache key for a channel link, @handle, video link or channel ID."""
+    kind, value = parse_channel_input(query.strip().rstrip("/"))
+    if kind in CASE_INSENSITIVE_KINDS:
+        value = value.lower()
+    elif kind == "search":
+        value = " ".join(value.split())
+    return f"{kind}:{value}"
+
+
+QUOTA_REASONS = ("quotaExceeded", "dailyLimitExceeded")
+
+
+def _quota_message(reset_in: float) -> str:
+    hours, minutes = divmod(int(reset_in) // 60, 60)
+    return (f"Дневная квота YouTube API исчерпана. Она обновится в полночь по тихоокеанскому времени "
+            f"(через {hours} ч {minutes} мин).")
+
+
+async def _yt_get(endpoint: str, **params) -> dict:
+    """One YouTube Data API GET, charged to the quota; a key YouTube reports
+    as exhausted is retired until the reset and the call retried on another."""
+    while True:
+        try:
+            key = quota.acquire(endpoint)
+        except QuotaExceeded as e:
+            raise YouTubeError(_quota_message(e.reset_in), status=503)
+        params["key"] = key.key
+        with telemetry.span("youtube", endpoint) as span:
+            async with http.session.get(f"{YT_API}/{endpoint}", params=params) as res:
+                span.status = res.status
+                span.bytes = len(await res.read())
+                if res.status == 200:
+                    return await res.json()
+                if res.status == 403:
+                    try:
+                        body = await res.json(content_type=None)
+                    except ValueError:
+                        body = {}
+                    reasons = {e.get("reason") for e in (body or {}).get("error", {}).get("errors", [])}
+                    if reasons.intersection(QUOTA_REASONS):
+                        logging.warning(f"YouTube key {key.id} out of quota, rotating")
+                        quota.mark_exhausted(key)
+                        continue
+                raise YouTubeError(f"Ошибка YouTube API: Код {res.status}")
+
+
+# URL-aware resolution via cheap 1-unit lookups; the 100-unit search is a last resort
+# and is switched off entirely when the quota is nearly gone
+# Names resolved through search are bounded (LRU + TTL); exact handle/video lookups are kept
+RESOLVER_SEARCH_MAX = int(os.getenv("RESOLVER_SEARCH_MAX", "5000"))
+RESOLVER_SEARCH_TTL = float(os.getenv("RESOLVER_SEARCH_TTL", str(7 * 86400)))
+resolver = ChannelResolver(_yt_get, ChannelIndex(persist=snapshots.put_index, search_max=RESOLVER_SEARCH_MAX,
+                                                 search_ttl=RESOLVER_SEARCH_TTL),
+                           can_search=lambda: quota.level() < NO_SEARCH)
+
+
+def _snapshot_max_age() -> float:
+    return QUOTA_STALE_MAX_AGE if quota.level() >= SERVE_STALE else SNAPSHOT_MAX_AGE
+
+
+# Deep analysis pages the whole uploads playlist: 2 units per 50 videos (playlistItems + videos).
+# The scan shrinks with each degradation level and is refused once search is.
+DEEP_MAX_VIDEOS = int(os.getenv("DEEP_MAX_VIDEOS", "3000"))
+DEEP_LEVEL_SHARE = (1.0, 0.25, 0.05, 0.0)  # NORMAL, SERVE_STALE, SKIP_LATEST, NO_SEARCH
+DEEP_REFUSED = ("🔬 Глубокий анализ временно недоступен: дневная квота YouTube API почти исчерпана. "
+                "Попробуйте после полуночи по тихоокеанскому времени.")
+
+
+def deep_scan_limit() -> int:
+    """How many videos a deep scan may read now; 0 means refuse it."""
+    if not quota:
+        return DEEP_MAX_VIDEOS
+    limit = int(DEEP_MAX_VIDEOS * DEEP_LEVEL_SHARE[quota.level()])
+    # Never plan a scan the remaining budget cannot pay for
+    affordable = (quota.limit() - quota.used()) // 2 * DEEP_PAGE_SIZE
+    return max(0, min(limit, affordable))
+
+
+async def fetch_channel_stats(channel_id: str) -> dict:
+    """Cached channel stats by ID; raises YouTubeError."""
+    return await channel_stats_cache.get_or_fetch(
+        channel_id, lambda: _load_channel_stats(channel_id), refresh=quota.level() < SERVE_STALE
+    )
+
+
+def stream_channel_videos(channel: dict, max_videos: int):
+    """Per-page (views, likes, comments, published_ts) rows for the channel's uploads; see deep.py."""
+    uploads = channel.get("uploads") or uploads_playlist_for(channel["id"])
+    return stream_video_stats(_yt_get, uploads, max_videos)
+
+
+async def _load_channel_stats(channel_id: str) -> dict:
+    """Serve a fresh enough snapshot from disk, otherwise hit the API and record it."""
+    channel = await snapshots.latest_channel(channel_id, max_age=_snapshot_max_age())
+    if channel:
+        return channel
+    channel = await _fetch_channel_stats(channel_id)
+    snapshots.record_channel(channel)
+    return channel
+
+
+async def _load_latest_video(uploads_playlist_id: str):
+    video = await snapshots.latest_video(uploads_playlist_id, max_age=_snapshot_max_age())
+    if video or quota.level() >= SKIP_LATEST:
+        # Low on quota: the latest video is a nice-to-have, skip its 2 API calls
+        return video
+    video = await _fetch_latest_video(uploads_playlist_id)
+    if video:
+        snapshots.record_latest_video(uploads_playlist_id, video)
+    return video
+
+
+def _parse_channel_item(info: dict) -> dict:
+    stats = info.get("statistics", {})
+    snippet = info.get("snippet", {})
+    related_playlists = info.get("contentDetails", {}).get("relatedPlaylists", {})
+    return {
+        "id": info["id"],
+        "name": snippet.get("title", "Unknown"),
+        "subs": int(stats.get("subscriberCount", 0)),
+        "views": int(stats.get("viewCount", 0)),
+        "videos": int(stats.get("videoCount", 0)),
+        "uploads": related_playlists.get("uploads"),
+    }
+
+
+async def _fetch_channel_stats(channel_id: str) -> dict:
+    channel_data = await _yt_get("channels", part="statistics,snippet,contentDetails", id=channel_id)
+    if not channel_data.get("items"):
+        raise YouTubeError("Не удалось получить статистику канала (данные отсутствуют).", status=404)
+    return _parse_channel_item(channel_data["items"][0])
+
+
+async def _fetch_latest_video(uploads_playlist_id: str):
+    pl_data = await _yt_get("playlistItems", part="snippet", playlistId=uploads_playlist_id, maxResults=1)
+    if not pl_data.get("items"):
+        return None
+    vid_id = pl_data["items"][0]["snippet"]["resourceId"]["videoId"]
+    vid_title = pl_data["items"][0]["snippet"]["title"]
+
+    # Get stats for this specific video
+    v_data = await _yt_get("videos", part="statistics", id=vid_id)
+    if not v_data.get("items"):
+        return None
+    v_stats = v_data["items"][0]["statistics"]
+    return {
+        "title": vid_title,
+        "views": int(v_stats.get("viewCount", 0)),
+        "likes": int(v_stats.get("likeCount", 0)),
+        "url": f"https://youtu.be/{vid_id}"
+    }
+
+
+async def fetch_youtube_data(query: str):
+    """Fetch channel stats and latest video details from YouTube API.
+
+    Returns (data, None) or (None, YouTubeError). Concurrent calls for the
+    same channel are coalesced into one fetch.
+    """
+    return await youtube_flight.do(normalize_query(query), lambda: _fetch_youtube_data(query))
+
+
+# Per-stage timeouts (seconds) and aggregate wall-clock timings for the fetch pipeline
+STAGE_TIMEOUTS = {
+    "resolve": float(os.getenv("YT_RESOLVE_TIMEOUT", "10")),
+    "stats": float(os.getenv("YT_STATS_TIMEOUT", "8")),
+    "latest": float(os.getenv("YT_LATEST_TIMEOUT", "6")),
+}
+stage_timings = {}
+
+SEARCH_REFUSED = ("Поиск канала по названию временно недоступен: дневная квота YouTube API почти исчерпана. "
+                  "Отправьте ссылку на канал, @handle или ссылку на видео.")
+SEARCH_DISABLED = "Поиск канала по названию здесь недоступен. Отправьте ссылку на канал, @handle или ссылку на видео."
+
+
+def uploads_playlist_for(channel_id: str) -> str:
+    """The uploads playlist ID is the channel ID with the UC prefix swapped for UU."""
+    return "UU" + channel_id[2:]
+
+
+async def _run_stage(name: str, timings: dict, fetch):
+    """Await ``fetch()`` under the stage timeout and record how long it took."""
+    agg = stage_timings.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "timeouts": 0})
+    start = time.perf_counter()
+    try:
+        return await asyncio.wait_for(fetch(), STAGE_TIMEOUTS[name])
+    except asyncio.TimeoutError:
+        agg["timeouts"] += 1
+        raise YouTubeError("YouTube API не ответил вовремя. Попробуйте ещё раз.", status=504)
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        timings[name] = round(elapsed, 1)
+        agg["count"] += 1
+        agg["total_ms"] += elapsed
+        agg["max_ms"] = max(agg["max_ms"], elapsed)
+
+
+async def _fetch_youtube_data(query: str):
+    if not quota:
+        return None, YouTubeError("YouTube API key is missing in .env", status=503)
+
+    # Basic validation
+    if not query:
+        return None, YouTubeError("Пустой запрос. Пожалуйста, отправьте ссылку или @username.", status=400)
+
+    timings = {}
+    started = time.perf_counter()
+    # Past the first quota threshold stale entries are served without a background refresh
+    refresh = quota.level() < SERVE_STALE
+
+    # 1. Resolve channel ID
+    try:
+        channel_id = await _run_stage("resolve", timings, lambda: channel_id_cache.get_or_fetch(
+            normalize_query(query), lambda: resolver.resolve(query), refresh=refresh
+        ))
+    except YouTubeError as e:
+        return None, e
+    except SearchRefused:
+        if search_budget.get() is None:
+            return None, YouTubeError(SEARCH_REFUSED, status=503)
+        if parse_channel_input(query)[0] == "search":
+            return None, YouTubeError(SEARCH_DISABLED, status=400)
+        channel_id = None  # a link or handle that the cheap lookups did not match
+    except Exception as e:
+        logging.error(f"Error resolving channel ID: {e}")
+        return None, YouTubeError("Произошла ошибка при поиске канала.")
+
+    if not channel_id:
+        return None, YouTubeError(
+            "Не удалось найти канал по этому запросу. Проверьте правильность ссылки или @username.", status=404
+        )
+
+    # 2 + 3. Channel stats and latest video only depend on the channel ID, so run them together
+    uploads_playlist_id = uploads_playlist_for(channel_id)
+    channel, latest_video = await asyncio.gather(
+        _run_stage("stats", timings, lambda: channel_stats_cache.get_or_fetch(
+            channel_id, lambda: _load_channel_stats(channel_id), refresh=refresh
+        )),
+        _run_stage("latest", timings, lambda: latest_video_cache.get_or_fetch(
+            uploads_playlist_id, lambda: _load_latest_video(uploads_playlist_id), refresh=refresh
+        )),
+        return_exceptions=True,
+    )
+    timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    logging.info(f"fetch_youtube_data {channel_id} timings(ms): {timings}")
+
+    if isinstance(channel, YouTubeError):
+        return None, channel
+    if isinstance(channel, BaseException):
+        logging.error(f"Error fetching channel stats: {channel}")
+        return None, YouTubeError("Произошла ошибка при получении статистики канала.")
+
+    if isinstance(latest_video, BaseException):
+        logging.error(f"Error fetching latest video: {latest_video}")
+        # We do not fail the whole request just because the latest video failed
+        latest_video = None
+
+    return {
+        "id": channel_id,
+        "name": channel["name"],
+        "subs": channel["subs"],
+        "views": channel["views"],
+        "videos": channel["videos"],
+        "latest": latest_video,
+        "timings": timings
+    }, None
+
+
+# --- Batch Helpers (channels?id= / videos?id= accept up to 50 IDs per call) ---
+YT_BATCH_SIZE = 50
+COMPARE_MAX_CHANNELS = int(os.getenv("COMPARE_MAX_CHANNELS", "300"))
+COMPARE_CONCURRENCY = int(os.getenv("COMPARE_CONCURRENCY", "10"))
+# Names that only search.list can resolve cost 100 units each; a list gets this many
+COMPARE_MAX_SEARCHES = int(os.getenv("COMPARE_MAX_SEARCHES", "3"))
+
+
+def _chunks(items: list, size: int = YT_BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+async def fetch_channels_batch(channel_ids: list) -> dict:
+    """Channel stats for many IDs: cache first, then one channels?id= call per 50 IDs."""
+    result = await channel_stats_cache.get_many(channel_ids)
+    missing = [channel_id for channel_id in channel_ids if channel_id not in result]
+
+    async def fetch_chunk(chunk):
+        data = await _yt_get("channels", part="statistics,snippet,contentDetails",
+                             id=",".join(chunk), maxResults=YT_BATCH_SIZE)
+        return [_parse_channel_item(item) for item in data.get("items", [])]
+
+    for channels in await asyncio.gather(*(fetch_chunk(c) for c in _chunks(missing))):
+        for channel in channels:
+            channel_stats_cache.set(channel["id"], channel)
+            snapshots.record_channel(channel)
+            result[channel["id"]] = channel
+    return result
+
+
+async def fetch_videos_batch(video_ids: list) -> dict:
+    """Video statistics keyed by video ID, one videos?id= call per 50 IDs."""
+    async def fetch_chunk(chunk):
+        data = await _yt_get("videos", part="statistics", id=",".join(chunk), maxResults=YT_BATCH_SIZE)
+        return data.get("items", [])
+
+    result = {}
+    for items in await asyncio.gather(*(fetch_chunk(c) for c in _chunks(video_ids))):
+        for item in items:
+            result[item["id"]] = item.get("statistics", {})
+    return result
+
+
+async def fetch_latest_videos_batch(uploads_ids: list) -> dict:
+    """Latest upload per playlist. playlistItems has no multi-ID form, so only the
+    video statistics are batched; playlist lookups run concurrently and are cached."""
+    result = await latest_video_cache.get_many(uploads_ids)
+    missing = [uploads for uploads in uploads_ids if uploads not in result]
+    if missing and quota.level() >= SKIP_LATEST:
+        return result
+
+    sem = asyncio.Semaphore(COMPARE_CONCURRENCY)
+
+    async def latest_item(uploads):
+        async with sem:
+            try:
+                data = await _yt_get("playlistItems", part="snippet", playlistId=uploads, maxResults=1)
+            except Exception as e:
+                logging.error(f"Error fetching latest upload for {uploads}: {e}")
+                return uploads, None
+        items = data.get("items")
+        return uploads, items[0]["snippet"] if items else None
+
+    heads = [h for h in await asyncio.gather(*(latest_item(u) for u in missing)) if h[1]]
+    video_stats = await fetch_videos_batch([s["resourceId"]["videoId"] for _, s in heads])
+    for uploads, snippet in heads:
+        vid_id = snippet["resourceId"]["videoId"]
+        v_stats = video_stats.get(vid_id)
+        if v_stats is None:
+            continue
+        video = {
+            "title": snippet["title"],
+            "views": int(v_stats.get("viewCount", 0)),
+            "likes": int(v_stats.get("likeCount", 0)),
+            "url": f"https://youtu.be/{vid_id}"
+        }
+        latest_video_cache.set(uploads, video)
+        snapshots.record_latest_video(uploads, video)
+        result[uploads] = video
+    return result
+
+
+async def compare_channels(queries: list):
+    """Resolve many channel queries concurrently and batch-fetch their stats.
+
+    Returns (rows sorted by subscribers, list of queries that failed to resolve).
+    At most COMPARE_MAX_SEARCHES entries may fall back to search (unless the
+    caller already set a tighter budget); the rest need links or handles.
+    """
+    sem = asyncio.Semaphore(COMPARE_CONCURRENCY)
+
+    async def resolve(query):
+        async with sem:
+            try:
+                return query, await channel_id_cache.get_or_fetch(
+                    normalize_query(query), lambda: resolver.resolve(query),
+                    refresh=quota.level() < SERVE_STALE
+                )
+            except SearchRefused:
+                return query, None
+            except Exception as e:
+                logging.error(f"Error resolving {query}: {e}")
+                return query, None
+
+    token = search_budget.set(SearchBudget(COMPARE_MAX_SEARCHES)) if search_budget.get() is None else None
+    try:
+        resolved = await asyncio.gather(*(resolve(q) for q in queries))
+    finally:
+        if token is not None:
+            search_budget.reset(token)
+    failed = [q for q, channel_id in resolved if not channel_id]
+    channel_ids = list(dict.fromkeys(channel_id for _, channel_id in resolved if channel_id))
+
+    channels = await fetch_channels_batch(channel_ids)
+    uploads_ids = [c["uploads"] for c in channels.values() if c.get("uploads")]
+    latest = await fetch_latest_videos_batch(uploads_ids)
+
+    rows = []
+    for channel_id in channel_ids:
+        channel = channels.get(channel_id)
+        if not channel:
+            continue
+        rows.append({**channel, "latest": latest.get(channel.get("uploads"))})
+    rows.sort(key=lambda c: c["subs"], reverse=True)
+    return rows, failed
+
+
+# --- Groq ---
+GROQ_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+GROQ_MODEL = "llama-3.3-70b-versatile"
+GROQ_TEMPERATURE = 0.7
+GROQ_STREAMING = os.getenv("GROQ_STREAMING", "1") == "1"
+GROQ_OVERLOADED = "❌ Groq API перегружен. Попробуйте ещё раз через минуту."
+
+# Content-addressed cache for tool answers (memory, or sqlite to survive restarts)
+_llm_cache_limits = dict(
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000")),
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+)
+llm_cache = LLMCache(
+    SQLiteBackend(os.getenv("LLM_CACHE_PATH", os.path.join(BASE_DIR, "llm_cache.db")), **_llm_cache_limits)
+    if os.getenv("LLM_CACHE_BACKEND", "memory") == "sqlite" else MemoryBackend(**_llm_cache_limits),
+    ttl=float(os.getenv("LLM_CACHE_TTL", "86400")),
+)
+
+# Concurrency cap, 429 backoff and short/long priority lanes for all Groq calls
+groq_scheduler = GroqScheduler(
+    concurrency=int(os.getenv("GROQ_CONCURRENCY", "4")),
+    max_retries=int(os.getenv("GROQ_MAX_RETRIES", "4")),
+)
+
+
+class GroqError(Exception):
+    """Groq failure whose message can be shown to the user as-is."""
+
+
+def groq_error_message(e: Exception) -> str:
+    """User-facing text for an exception raised by a scheduled Groq call."""
+    if isinstance(e, GroqError):
+        return str(e)
+    if isinstance(e, RateLimited):
+        return GROQ_OVERLOADED
+    logging.error(f"Groq call failed: {e}")
+    return f"❌ Ошибка соединения с Groq: {e}"
+
+
+def _groq_request(prompt: str, system_prompt: str = "", max_tokens: int = 2048, stream: bool = False):
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": prompt})
+
+    headers = {
+        "Authorization": f"Bearer {GROQ_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "model": GROQ_MODEL,
+        "messages": messages,
+        "temperature": GROQ_TEMPERATURE,
+        "max_tokens": max_tokens
+    }
+    if stream:
+        payload["stream"] = True
+    return headers, payload
+
+
+def build_tips_prompt(channel_info) -> str:
+    prompt = (
+        f"You are an elite YouTube growth expert. Analyze this channel briefly:\n"
+        f"Channel: {channel_info['name']}\n"
+        f"Subscribers: {channel_info['subs']}\n"
+        f"Total Views: {channel_info['views']}\n"
+        f"Videos given: {channel_info['videos']}\n"
+    )
+    if channel_info.get("latest"):
+        latest = channel_info["latest"]
+        prompt += f"Latest video: '{latest['title']}' with {latest['views']} views.\n"
+    if channel_info.get("metrics"):
+        prompt += f"\nFull upload history analytics:\n{metrics_for_prompt(channel_info['metrics'])}\n"
+
+    prompt += (
+        "\nProvide 3 highly specific, actionable tips in Russian to grow this specific channel right now. "
+        "Use formatting (bold, emojis) to make it easy to read in Telegram."
+    )
+    return prompt
+
+
+def _groq_cost(prompt: str, max_tokens: int) -> int:
+    """Rough token estimate used against the x-ratelimit tokens budget."""
+    return len(prompt) // 4 + max_tokens
+
+
+async def _groq_complete(headers: dict, payload: dict) -> str:
+    """One non-streaming attempt; raises RateLimited on 429 so the scheduler can retry."""
+    with telemetry.span("groq", "chat") as span:
+        async with http.session.post(GROQ_URL, headers=headers, json=payload) as res:
+            span.status = res.status
+            span.bytes = len(await res.read())
+            groq_scheduler.update_from_headers(res.headers)
+            if res.status == 429:
+                raise RateLimited(parse_duration(res.headers.get("retry-after")))
+            if not res.ok:
+                data = await res.json(content_type=None)
+                raise GroqError(f"❌ Ошибка Groq API: {data.get('error', {}).get('message', res.status)}")
+            data = await res.json()
+            telemetry.record_usage(payload["model"], data.get("usage"), span)
+            return data["choices"][0]["message"]["content"]
+
+
+async def _groq_stream_call(prompt: str, system_prompt: str = "", max_tokens: int = 2048):
+    """Yield completion text deltas as Groq produces them (``stream: true``)."""
+    headers, payload = _groq_request(prompt, system_prompt, max_tokens, stream=True)
+    # Long generations must not hit the pool's total timeout; only guard against stalls
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=30)
+    with telemetry.span("groq", "chat_stream") as span:
+        async with http.session.post(GROQ_URL, headers=headers, json=payload, timeout=timeout) as res:
+            span.status = res.status
+            groq_scheduler.update_from_headers(res.headers)
+            if res.status == 429:
+                raise RateLimited(parse_duration(res.headers.get("retry-after")))
+            if not res.ok:
+                data = await res.json(content_type=None)
+                raise GroqError(f"❌ Ошибка Groq API: {data.get('error', {}).get('message', res.status)}")
+            meta = {}
+            try:
+                async for delta in iter_sse_content(res, meta):
+                    yield delta
+            finally:
+                span.bytes = meta.get("bytes", 0)
+                telemetry.record_usage(payload["model"], meta.get("usage"), span)
+
+
+# --- AI Tool Prompts ---
+def build_titles_prompt(titles: str) -> str:
+    return (
+        "You are a YouTube CTR and psychology expert.\n"
+        "Analyze these titles for a video and determine which will get the highest click-through rate:\n\n"
+        f"{titles}\n\n"
+        "СТРОГОЕ ПРАВИЛО: ОТВЕЧАЙ ИСКЛЮЧИТЕЛЬНО НА РУССКОМ ЯЗЫКЕ.\n\n"
+        "Provide your analysis formatted in Markdown.\n"
+        "1. Declare the WINNER clearly.\n"
+        "2. Give a CTR prediction out of 100 for each.\n"
+        "3. Explain the psychological triggers.\n"
+        "4. Provide ONE new 'God-Tier' title that is even better."
+    )
+
+def build_hooks_prompt(topic: str) -> str:
+    return (
+        "You are a high-retention YouTube Shorts and Video scriptwriter.\n"
+        f"Video Topic: \"{topic}\"\n\n"
+        "СТРОГОЕ ПРАВИЛО: ОТВЕЧАЙ ИСКЛЮЧИТЕЛЬНО НА РУССКОМ ЯЗЫКЕ.\n\n"
+        "Generate 3 distinct, high-impact verbal hooks for the first 3-5 seconds of this video.\n"
+        "Format in Markdown:\n"
+        "- **Hook 1 (The Question/Curiosity Gap)**\n"
+        "- **Hook 2 (The Negative Statement/Shock)**\n"
+        "- **Hook 3 (The Ultra-Specific Value Promise)**\n"
+        "Include brief visual direction for each (e.g., [Camera rapidly zooms in])."
+    )
+
+def build_script_prompt(idea: str) -> str:
+    return (
+        "You are a legendary YouTube Producer and Scriptwriter who has helped creators gain millions of views.\n"
+        "I have an idea for a video. You need to turn it into a complete, ready-to-shoot production plan.\n\n"
+        f"Topic / Idea: \"{idea}\"\n\n"
+        "СТРОГОЕ ПРАВИЛО: ОТВЕЧАЙ ИСКЛЮЧИТЕЛЬНО НА РУССКОМ ЯЗЫКЕ (включая сценарии, хуки и инструкции).\n\n"
+        "Create a highly structured production guide in Markdown format. Use emojis and bold text. "
+        "It MUST contain these exact sections:\n"
+        "# 🎬 1. Идея и Угол подачи (Curiosity gap)\n"
+        "# 💥 2. Топ-3 Кликбейтных названия\n"
+        "# 🖼️ 3. Идея Превью (Thumbnail)\n"
+        "# 🪝 4. 5-секундный вирусный хук (Сценарий дословно)\n"
+        "# 📜 5. Структура сценария (3 Акта)\n"
+        "# ⏱️ 6. Точка удержания (Pattern interrupt)\n"
+        "# 📢 7. Призыв к действию (CTA)"
+    )
+
+
+# tool -> (prompt builder, scheduler lane)
+TOOL_PROMPTS = {
+    "titles": (build_titles_prompt, "short"),
+    "hooks": (build_hooks_prompt, "short"),
+    "script": (build_script_prompt, "long"),
+}
+
+
+async def run_tool(tool: str, user_input: str, use_cache: bool = True):
+    """Non-streaming tool answer through the LLM cache. Returns (text, cached, error)."""
+    build_prompt, lane = TOOL_PROMPTS[tool]
+    prompt = build_prompt(user_input)
+    return await complete_cached(tool, prompt, lane=lane, use_cache=use_cache)
+
+
+async def complete_cached(tool: str, prompt: str, system_prompt: str = "", max_tokens: int = 2048,
+                          lane: str = "long", use_cache: bool = True, on_delta=None):
+    """Groq completion keyed in the LLM cache. Returns (text, cached, error).
+
+    ``tool`` names the cache bucket (None skips the cache); ``use_cache=False``
+    skips the lookup but still stores the fresh answer. With ``on_delta`` the
+    answer is streamed (if GROQ_STREAMING is on) and every piece, or a cached
+    answer in one piece, is passed to ``await on_delta(text)`` as it arrives.
+    """
+    if not GROQ_API_KEY:
+        return None, False, "Groq API key is missing in .env."
+    key = cache_key(GROQ_MODEL, system_prompt, prompt, GROQ_TEMPERATURE, max_tokens) if tool else None
+    if key:
+        if use_cache:
+            cached = await llm_cache.get(tool, key)
+            if cached is not None:
+                if on_delta is not None:
+                    await on_delta(cached)
+                return cached, True, None
+        else:
+            llm_cache.bypass(tool)
+
+    parts = []
+
+    async def run():
+        if on_delta is not None and GROQ_STREAMING:
+            async for delta in _groq_stream_call(prompt, system_prompt, max_tokens):
+                parts.append(delta)
+                await on_delta(delta)
+            return
+        headers, payload = _groq_request(prompt, system_prompt, max_tokens)
+        parts.append(await _groq_complete(headers, payload))
+        if on_delta is not None:
+            await on_delta(parts[-1])
+
+    try:
+        await groq_scheduler.run(lane, run, cost=_groq_cost(prompt, max_tokens))
+    except Exception as e:
+        return None, False, groq_error_message(e)
+    text = "".join(parts)
+    if key and text:
+        await llm_cache.set(tool, key, text)
+    return text, False, None
+
+
+# --- Telemetry ---
+# Existing subsystem stats, read at scrape time (nothing extra on the hot path)
+_CACHES = (channel_id_cache, channel_stats_cache, latest_video_cache)
+telemetry.registry.collect("cache_entries", "Entries in the in-process caches", lambda: {
+    (("cache", c.name),): c.snapshot()["size"] for c in _CACHES
+})
+telemetry.registry.collect("cache_events_total", "Cache lookups by result, plus evictions and L2 traffic", lambda: {
+    (("cache", c.name), ("event", event)): c.stats[event]
+    for c in _CACHES for event in ("hits", "stale_hits", "misses", "evictions", "refreshes", "l2_hits", "l2_errors")
+}, kind="counter")
+telemetry.registry.collect("llm_cache_lookups_total", "LLM answer cache lookups per tool", lambda: {
+    (("tool", tool), ("result", result)): s[result]
+    for tool, s in llm_cache.stats.items() for result in ("hits", "misses", "bypassed")
+}, kind="counter")
+telemetry.registry.collect("singleflight_calls_total", "YouTube lookups, and how many were coalesced", lambda: {
+    (("result", k),): youtube_flight.stats[k] for k in ("calls", "coalesced")
+}, kind="counter")
+telemetry.registry.collect("http_pool_events_total", "Shared HTTP pool requests and connection reuse", lambda: {
+    (("event", k),): v for k, v in http.stats.items()
+}, kind="counter")
+telemetry.registry.collect("groq_lane_depth", "Groq calls waiting or running per lane", lambda: {
+    (("lane", lane), ("state", state)): s[state]
+    for lane, s in groq_scheduler.snapshot()["lanes"].items() for state in ("queued", "active")
+})
+telemetry.registry.collect("youtube_quota_units", "YouTube quota units for the current Pacific day", lambda: {
+    (("kind", "used"),): quota.used(), (("kind", "limit"),): quota.limit(), (("kind", "level"),): quota.level(),
+})
+telemetry.registry.collect("youtube_quota_feature_units", "YouTube quota units spent today per feature", lambda: {
+    (("feature", feature),): units for feature, units in quota.features.items()
+})
+_dump_task = None
+
+
+# --- Lifecycle ---
+async def start():
+    global _dump_task
+    await http.start()
+    await quota.start()
+    if shared_kv:
+        await shared_kv.start()
+    await snapshots.start()
+    await llm_cache.start()
+    resolver.index.load(await snapshots.load_index())
+    _dump_task = asyncio.create_task(telemetry.dump_loop())
+
+
+async def close():
+    if _dump_task is not None:
+        _dump_task.cancel()
+    logging.info(f"HTTP pool stats: {http.snapshot()}")
+    logging.info(f"YouTube quota: {quota.snapshot()}")
+    await http.close()
+    await quota.close()
+    await snapshots.close()
+    await llm_cache.close()
+    if shared_kv:
+        for cache in (channel_id_cache, channel_stats_cache, latest_video_cache):
+            await cache.flush()
+        await shared_kv.close()
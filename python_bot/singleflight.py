@@ -0,0 +1,52 @@
+"""Single-flight request coalescing.
+
+Concurrent callers asking for the same key share one in-flight task, so N
+simultaneous lookups of a viral channel cost one set of upstream calls. The
+result (including an error result or exception) is handed to every waiter
+but nothing is kept once the call completes; caching is the TTLCache's job.
+"""
+import asyncio
+import functools
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight = {}  # key -> [shared task, callers waiting on it]
+        self.stats = {"calls": 0, "executions": 0, "coalesced": 0}
+
+    async def do(self, key, fn):
+        """Run ``fn()`` for ``key`` unless an identical call is already running."""
+        self.stats["calls"] += 1
+        entry = self._inflight.get(key)
+        if entry is None:
+            self.stats["executions"] += 1
+            # The call runs in its own task, owned by no caller in particular
+            entry = self._inflight[key] = [asyncio.ensure_future(fn()), 0]
+            entry[0].add_done_callback(functools.partial(self._done, key))
+        else:
+            self.stats["coalesced"] += 1
+
+        task = entry[0]
+        entry[1] += 1
+        try:
+            # shield: a cancelled caller only stops waiting, whether it started the call or joined it
+            return await asyncio.shield(task)
+        finally:
+            entry[1] -= 1
+            if not entry[1] and not task.done():
+                # Nobody is left to use the result
+                task.cancel()
+                if self._inflight.get(key) is entry:
+                    del self._inflight[key]
+
+    def _done(self, key, task):
+        entry = self._inflight.get(key)
+        if entry is not None and entry[0] is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark retrieved so an exception nobody else awaited is not logged
+            task.exception()
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "inflight": len(self._inflight)}
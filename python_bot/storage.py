@@ -0,0 +1,218 @@
+"""SQLite-backed persistent store for channel snapshots.
+
+Every channel stats fetch is appended to a ``snapshots`` table indexed on
+(channel_id, ts), so growth can be shown without another API round trip and
+a restart does not cold-start every cache. The database runs in WAL mode;
+writes are queued in memory and flushed in batches from a worker thread so
+the event loop never blocks on disk I/O.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    channel_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    name TEXT,
+    subs INTEGER,
+    views INTEGER,
+    videos INTEGER,
+    uploads TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_snapshots_channel_ts ON snapshots (channel_id, ts);
+CREATE TABLE IF NOT EXISTS latest_videos (
+    uploads TEXT PRIMARY KEY,
+    ts REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS channel_index (
+    key TEXT PRIMARY KEY,
+    channel_id TEXT NOT NULL,
+    ts REAL
+);
+"""
+
+INSERT_SNAPSHOT = (
+    "INSERT INTO snapshots (channel_id, ts, name, subs, views, videos, uploads) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+UPSERT_LATEST = "INSERT OR REPLACE INTO latest_videos (uploads, ts, data) VALUES (?, ?, ?)"
+UPSERT_INDEX = "INSERT OR REPLACE INTO channel_index (key, channel_id, ts) VALUES (?, ?, ?)"
+DELETE_INDEX = "DELETE FROM channel_index WHERE key = ?"
+
+
+class SnapshotStore:
+    def __init__(self, path: str, batch_size: int = 50, flush_interval: float = 2.0,
+                 retention_days: float = 90):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self._pending = []
+        self._wake = None
+        self._writer_task = None
+        self._closing = False
+        self._write_conn = None
+        self._read_conn = None
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self.stats = {"writes": 0, "batches": 0, "reads": 0, "read_hits": 0}
+
+    # --- Lifecycle ---
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _open(self):
+        self._write_conn = self._connect()
+        self._write_conn.executescript(SCHEMA)
+        columns = {row["name"] for row in self._write_conn.execute("PRAGMA table_info(channel_index)")}
+        if "ts" not in columns:
+            # Older databases: free-text search keys start their TTL now, exact lookups stay
+            self._write_conn.execute("ALTER TABLE channel_index ADD COLUMN ts REAL")
+            self._write_conn.execute("UPDATE channel_index SET ts = ? WHERE key LIKE 'search:%'",
+                                     (time.time(),))
+        if self.retention_days:
+            cutoff = time.time() - self.retention_days * 86400
+            self._write_conn.execute("DELETE FROM snapshots WHERE ts < ?", (cutoff,))
+        self._read_conn = self._connect()
+
+    async def start(self):
+        await asyncio.to_thread(self._open)
+        self._wake = asyncio.Event()
+        self._closing = False
+        self._writer_task = asyncio.create_task(self._writer())
+
+    async def close(self):
+        if self._writer_task:
+            self._closing = True
+            self._wake.set()
+            await self._writer_task
+            self._writer_task = None
+        await self.flush()
+        for conn in (self._write_conn, self._read_conn):
+            if conn is not None:
+                conn.close()
+        self._write_conn = self._read_conn = None
+
+    # --- Batched writes ---
+    def _enqueue(self, sql: str, params: tuple):
+        self._pending.append((sql, params))
+        if len(self._pending) >= self.batch_size and self._wake is not None:
+            self._wake.set()
+
+    async def _writer(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Snapshot batch write failed: {e}")
+
+    async def flush(self):
+        if not self._pending or self._write_conn is None:
+            return
+        batch, self._pending = self._pending, []
+        await asyncio.to_thread(self._write_batch, batch)
+
+    def _write_batch(self, batch: list):
+        # Group consecutive rows with the same statement into one executemany
+        groups = []
+        for sql, params in batch:
+            if groups and groups[-1][0] == sql:
+                groups[-1][1].append(params)
+            else:
+                groups.append((sql, [params]))
+        with self._write_lock:
+            conn = self._write_conn
+            conn.execute("BEGIN")
+            try:
+                for sql, rows in groups:
+                    conn.executemany(sql, rows)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self.stats["writes"] += len(batch)
+        self.stats["batches"] += 1
+
+    def record_channel(self, channel: dict):
+        self._enqueue(INSERT_SNAPSHOT, (
+            channel["id"], time.time(), channel["name"], channel["subs"],
+            channel["views"], channel["videos"], channel.get("uploads"),
+        ))
+
+    def record_latest_video(self, uploads: str, video: dict):
+        self._enqueue(UPSERT_LATEST, (uploads, time.time(), json.dumps(video, ensure_ascii=False)))
+
+    def put_index(self, key: str, channel_id, ts=None):
+        """Upsert a resolver mapping; ``channel_id=None`` deletes it."""
+        if channel_id is None:
+            self._enqueue(DELETE_INDEX, (key,))
+        else:
+            self._enqueue(UPSERT_INDEX, (key, channel_id, ts))
+
+    # --- Reads ---
+    async def _query(self, sql: str, params: tuple):
+        if self._read_conn is None:
+            return []
+
+        def run():
+            with self._read_lock:
+                return self._read_conn.execute(sql, params).fetchall()
+
+        self.stats["reads"] += 1
+        return await asyncio.to_thread(run)
+
+    async def latest_channel(self, channel_id: str, max_age: float):
+        """Most recent snapshot younger than ``max_age`` seconds, or None."""
+        rows = await self._query(
+            "SELECT * FROM snapshots WHERE channel_id = ? AND ts >= ? ORDER BY ts DESC LIMIT 1",
+            (channel_id, time.time() - max_age),
+        )
+        if not rows:
+            return None
+        self.stats["read_hits"] += 1
+        row = rows[0]
+        return {
+            "id": row["channel_id"], "name": row["name"], "subs": row["subs"],
+            "views": row["views"], "videos": row["videos"], "uploads": row["uploads"],
+        }
+
+    async def latest_video(self, uploads: str, max_age: float):
+        rows = await self._query(
+            "SELECT data FROM latest_videos WHERE uploads = ? AND ts >= ?",
+            (uploads, time.time() - max_age),
+        )
+        if not rows:
+            return None
+        self.stats["read_hits"] += 1
+        return json.loads(rows[0]["data"])
+
+    async def snapshot_before(self, channel_id: str, before: float):
+        """Newest snapshot taken before the ``before`` timestamp (for growth deltas)."""
+        rows = await self._query(
+            "SELECT ts, subs, views, videos FROM snapshots "
+            "WHERE channel_id = ? AND ts < ? ORDER BY ts DESC LIMIT 1",
+            (channel_id, before),
+        )
+        return dict(rows[0]) if rows else None
+
+    async def load_index(self) -> dict:
+        """``{key: (channel_id, ts)}``; ``ts`` is None for mappings that never expire."""
+        rows = await self._query("SELECT key, channel_id, ts FROM channel_index", ())
+        return {row["key"]: (row["channel_id"], row["ts"]) for row in rows}
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "pending": len(self._pending)}
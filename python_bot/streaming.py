@@ -0,0 +1,125 @@
+"""Progressive Telegram output for streamed Groq completions.
+
+``iter_sse_content`` turns an OpenAI-compatible ``stream: true`` response
+into text deltas. ``TelegramStreamWriter`` renders those deltas into a
+message with coalesced edits (at most one per ``interval`` seconds, or
+sooner on a paragraph boundary) to stay inside Telegram's edit rate
+limits, and rolls over into follow-up messages before the 4096 char limit.
+"""
+import asyncio
+import html
+import json
+import logging
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+TELEGRAM_LIMIT = 4096
+CURSOR = " ▌"
+
+
+async def iter_sse_content(response, meta: dict = None):
+    """Yield content deltas from a chat-completions SSE stream.
+
+    If ``meta`` is given it receives the bytes read and the ``usage`` object
+    (Groq sends it in ``x_groq`` on the last chunk).
+    """
+    async for raw in response.content:
+        if meta is not None:
+            meta["bytes"] = meta.get("bytes", 0) + len(raw)
+        line = raw.decode("utf-8").strip()
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        chunk = json.loads(data)
+        if chunk.get("error"):
+            raise RuntimeError(chunk["error"].get("message", "stream error"))
+        if meta is not None:
+            usage = chunk.get("usage") or chunk.get("x_groq", {}).get("usage")
+            if usage:
+                meta["usage"] = usage
+        choices = chunk.get("choices") or [{}]
+        delta = choices[0].get("delta", {}).get("content")
+        if delta:
+            yield delta
+
+
+class TelegramStreamWriter:
+    def __init__(self, message, header: str = "", interval: float = 1.0,
+                 paragraph_interval: float = 0.4, limit: int = TELEGRAM_LIMIT - 96):
+        self.messages = [message]
+        self.header = header
+        self.interval = interval
+        self.paragraph_interval = paragraph_interval
+        self.limit = limit
+        self.body = ""
+        self._parts = []
+        self._last_edit = 0.0
+        self._not_before = 0.0
+        self.edits = 0
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def _prefix(self) -> str:
+        # Only the first message carries the header
+        return self.header if len(self.messages) == 1 else ""
+
+    def _render(self, body: str, cursor: bool) -> str:
+        return self._prefix() + html.escape(body) + (CURSOR if cursor else "")
+
+    async def _edit(self, msg, text: str, final: bool = False, **kwargs):
+        for _ in range(3 if final else 1):
+            try:
+                await msg.edit_text(text, disable_web_page_preview=True, **kwargs)
+                self.edits += 1
+                return
+            except TelegramRetryAfter as e:
+                self._not_before = time.monotonic() + e.retry_after
+                if not final:
+                    return
+                await asyncio.sleep(e.retry_after)
+            except TelegramBadRequest as e:
+                # "message is not modified" and friends are harmless here
+                logging.debug(f"Skipped stream edit: {e}")
+                return
+
+    async def feed(self, delta: str):
+        self._parts.append(delta)
+        self.body += delta
+        while len(self._render(self.body, cursor=True)) > self.limit:
+            await self._rollover()
+
+        now = time.monotonic()
+        if now < self._not_before:
+            return
+        since = now - self._last_edit
+        if since >= self.interval or ("\n\n" in delta and since >= self.paragraph_interval):
+            self._last_edit = now
+            await self._edit(self.messages[-1], self._render(self.body, cursor=True))
+
+    async def _rollover(self):
+        room = self.limit - len(self._prefix())
+        cut = min(len(self.body), room)
+        while cut > 0 and len(html.escape(self.body[:cut])) > room:
+            cut -= max(1, cut // 20)
+        # Prefer to break on a line boundary in the second half of the chunk
+        newline = self.body.rfind("\n", 0, cut)
+        if newline > cut // 2:
+            cut = newline
+        head, self.body = self.body[:cut], self.body[cut:].lstrip("\n")
+        await self._edit(self.messages[-1], self._render(head, cursor=False), final=True)
+        self.messages.append(await self.messages[-1].answer("…"))
+        self._last_edit = time.monotonic()
+
+    async def finish(self, footer: str = "", reply_markup=None) -> str:
+        """Final render without the cursor; attaches ``reply_markup`` to the last message."""
+        text = self._render(self.body, cursor=False) + footer
+        if len(text) > TELEGRAM_LIMIT:
+            await self._rollover()
+            text = self._render(self.body, cursor=False) + footer
+        await self._edit(self.messages[-1], text, final=True, reply_markup=reply_markup)
+        return self.text
@@ -0,0 +1,286 @@
+"""In-process metrics and lightweight tracing.
+
+Histograms and counters are plain dicts keyed by label values, cheap
+enough to record on every update and every upstream call. ``render()``
+produces the Prometheus text format for a ``/metrics`` endpoint, and
+``dump_loop()`` logs the same numbers as one JSON line per interval.
+``span()`` times a YouTube or Groq call. Each Telegram update is sampled
+once (``TELEMETRY_SAMPLE_RATE``); sampled updates also log every span
+they make as a JSON trace line tagged with the update's trace id.
+"""
+import asyncio
+import bisect
+import hmac
+import inspect
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram import BaseMiddleware
+from aiohttp import web
+
+SAMPLE_RATE = float(os.getenv("TELEMETRY_SAMPLE_RATE", "0.01"))
+DUMP_INTERVAL = float(os.getenv("TELEMETRY_DUMP_INTERVAL", "60"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+log = logging.getLogger("telemetry")
+
+# (trace id, sampled) of the update being handled; spans outside an update sample on their own
+current_trace = ContextVar("telemetry_trace", default=None)
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.values = {}
+
+    def inc(self, *labels, value: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+    def snapshot(self) -> dict:
+        return {"/".join(map(str, labels)) or "total": value for labels, value in self.values.items()}
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.buckets = buckets
+        self.series = {}  # labels -> [per-bucket counts (+Inf last), sum, count]
+
+    def observe(self, value: float, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def quantile(self, q: float, *labels) -> float:
+        """Upper bound of the bucket holding the q-th observation (what Prometheus would estimate)."""
+        counts, _, count = self.series.get(labels, (None, 0, 0))
+        if not count:
+            return 0.0
+        rank, seen = q * count, 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+    def snapshot(self) -> dict:
+        def ms(q, labels):
+            bound = self.quantile(q, *labels)
+            return bound * 1000 if bound != float("inf") else None  # past the last bucket
+
+        return {
+            "/".join(map(str, labels)) or "total": {
+                "count": count,
+                "avg_ms": round(total / count * 1000, 1),
+                "p50_ms": ms(0.5, labels),
+                "p95_ms": ms(0.95, labels),
+                "p99_ms": ms(0.99, labels),
+            }
+            for labels, (_, total, count) in self.series.items()
+        }
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collect(self, name: str, help: str, fn, kind: str = "gauge"):
+        """Register a metric read at scrape time from existing stats; ``fn()`` returns
+        {((label, value), ...): number}. Use ``kind="counter"`` for monotonic stats."""
+        self.collectors.append((name, help, kind, fn))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        for name, help, kind, fn in self.collectors:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            try:
+                for pairs, value in fn().items():
+                    labels = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+                    lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+            except Exception as e:
+                log.warning(f"Metrics collector {name} failed: {e}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+
+registry = Registry()
+
+handler_latency = registry.histogram(
+    "bot_handler_duration_seconds", "Telegram handler latency", ("handler", "event"))
+handler_errors = registry.counter(
+    "bot_handler_errors_total", "Telegram handlers that raised", ("handler", "event"))
+upstream_latency = registry.histogram(
+    "upstream_request_duration_seconds", "YouTube/Groq call latency, body included", ("service", "op", "status"))
+upstream_bytes = registry.counter(
+    "upstream_response_bytes_total", "Response bytes read from YouTube/Groq", ("service", "op"))
+llm_tokens = registry.counter(
+    "llm_tokens_total", "Groq tokens reported in the response usage field", ("model", "kind"))
+
+
+# --- Tracing ---
+def _sampled() -> tuple:
+    trace = current_trace.get()
+    if trace is None:
+        return None, random.random() < SAMPLE_RATE
+    return trace
+
+
+class Span:
+    __slots__ = ("service", "op", "status", "bytes", "attrs")
+
+    def __init__(self, service: str, op: str):
+        self.service = service
+        self.op = op
+        self.status = None
+        self.bytes = 0
+        self.attrs = {}
+
+
+@contextmanager
+def span(service: str, op: str):
+    """Time one upstream call; set ``.status``, ``.bytes`` and ``.attrs`` on the yielded span."""
+    s = Span(service, op)
+    start = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        if s.status is None:
+            s.status = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        status = s.status if s.status is not None else "ok"
+        upstream_latency.observe(elapsed, service, op, status)
+        if s.bytes:
+            upstream_bytes.inc(service, op, value=s.bytes)
+        trace_id, sampled = _sampled()
+        if sampled:
+            log.info(json.dumps({"event": "span", "trace": trace_id, "service": service, "op": op,
+                                 "status": status, "bytes": s.bytes, "ms": round(elapsed * 1000, 1), **s.attrs}))
+
+
+def record_usage(model: str, usage: dict, s: Span = None):
+    """Count prompt/completion tokens from an OpenAI-style ``usage`` object."""
+    if not usage:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            llm_tokens.inc(model, kind.split("_")[0], value=usage[kind])
+    if s is not None:
+        s.attrs.update({k: usage[k] for k in ("prompt_tokens", "completion_tokens") if k in usage})
+
+
+class TelemetryMiddleware(BaseMiddleware):
+    """Inner middleware: per-handler latency, error counts and head-based trace sampling."""
+
+    def __init__(self, event: str):
+        self.event = event
+
+    async def __call__(self, handler, event, data):
+        callback = inspect.unwrap(data["handler"].callback)
+        name = callback.__name__
+        trace_id = uuid.uuid4().hex[:16] if (sampled := random.random() < SAMPLE_RATE) else None
+        token = current_trace.set((trace_id, sampled))
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            return await handler(event, data)
+        except Exception:
+            outcome = "error"
+            handler_errors.inc(name, self.event)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            handler_latency.observe(elapsed, name, self.event)
+            current_trace.reset(token)
+            if sampled:
+                log.info(json.dumps({"event": "update", "trace": trace_id, "handler": name,
+                                     "type": self.event, "outcome": outcome, "ms": round(elapsed * 1000, 1)}))
+
+
+def instrument(router):
+    """Attach the handler middleware to the message and callback query observers of ``router``."""
+    router.message.middleware(TelemetryMiddleware("message"))
+    router.callback_query.middleware(TelemetryMiddleware("callback_query"))
+
+
+# --- Export ---
+async def dump_loop(interval: float = DUMP_INTERVAL):
+    """Log the registry as one JSON line every ``interval`` seconds (0 disables)."""
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        log.info(json.dumps({"event": "metrics", "pid": os.getpid(), **registry.snapshot()}))
+
+
+def authorized(request) -> bool:
+    """False when ``METRICS_TOKEN`` is set and the request lacks ``Authorization: Bearer <token>``."""
+    token = os.getenv("METRICS_TOKEN")
+    return not token or hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")
+
+
+async def metrics_handler(request):
+    """aiohttp handler serving the registry in Prometheus text format."""
+    if not authorized(request):
+        return web.Response(status=401)
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8",
+                        headers={"Cache-Control": "no-store"})
@@ -3,12 +3,45 @@ Channel Analytics Pro — Dev Server
 Serves static files with CORS headers.
 Run: python server.py
 Then open: http://localhost:8081
+
+Production mode: python server.py --prod
+Threaded HTTP/1.1 server with keep-alive. Assets are precompressed (gzip,
+plus brotli when the ``brotli`` package is installed) and served by content
+negotiation with strong ETags, 304s and byte ranges. JS/CSS get
+content-hashed names (script.3f2a9c1d.js) rewritten into index.html and are
+cached as immutable.
+
+API mode: python server.py --api
+aiohttp app serving the same static bundle plus a JSON API (/api/channel,
+/api/compare, /api/ai/<tool>) on top of the bot's fetch layer
+(python_bot/services.py). Every Mini App user then shares one warm cache and
+the API keys stay on the server.
 """
+import argparse
+import gzip
+import hashlib
+import hmac
 import http.server
+import json
+import os
+import re
 import socketserver
 import sys
+import time
+from urllib.parse import parse_qsl
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+try:
+    from aiohttp import web
+except ImportError:  # optional: only --api needs the bot's dependencies
+    web = None
 
 PORT = 8081
+ROOT = os.path.dirname(os.path.abspath(__file__))
 
 
 class CORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
@@ -33,10 +66,524 @@ class ReuseAddrServer(socketserver.TCPServer):
     allow_reuse_address = True
 
 
-if __name__ == '__main__':
-    with ReuseAddrServer(("", PORT), CORSHTTPRequestHandler) as httpd:
-        print(f"[OK] Channel Analytics Pro: http://localhost:{PORT}")
-        print(f"     AI: Groq API (direct from browser, no proxy)")
-        print(f"     Press Ctrl+C to stop.")
+# --- Production static bundle ---
+CONTENT_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.js': 'text/javascript; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.json': 'application/manifest+json; charset=utf-8',
+    '.svg': 'image/svg+xml',
+    '.png': 'image/png',
+    '.ico': 'image/x-icon',
+}
+HASHED_EXTS = ('.js', '.css')
+COMPRESSIBLE_EXTS = ('.html', '.js', '.css', '.json', '.svg')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+MIN_COMPRESS_SIZE = 512
+
+
+class Asset:
+    """One file held in memory with its precompressed variants and ETags."""
+
+    def __init__(self, path: str, body: bytes, cache_control: str):
+        self.path = path
+        self.content_type = CONTENT_TYPES.get(os.path.splitext(path)[1], 'application/octet-stream')
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.variants = {'identity': body}
+        if path.endswith(COMPRESSIBLE_EXTS) and len(body) >= MIN_COMPRESS_SIZE:
+            self.variants['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.variants['br'] = brotli.compress(body, quality=11)
+            # Keep a variant only if it actually saves bytes
+            for enc in [e for e in self.variants if e != 'identity']:
+                if len(self.variants[enc]) >= len(body):
+                    del self.variants[enc]
+
+    def etag(self, encoding: str) -> str:
+        # Strong validators must differ per representation
+        suffix = '' if encoding == 'identity' else f'-{encoding}'
+        return f'"{self.digest[:20]}{suffix}"'
+
+
+class StaticBundle:
+    """Built once at startup: hashed asset names, precompression, rewritten index.html."""
+
+    def __init__(self, root: str = ROOT):
+        self.root = root
+        self.assets = {}
+        self.build()
+
+    def _files(self):
+        for name in sorted(os.listdir(self.root)):
+            if os.path.splitext(name)[1] in CONTENT_TYPES and os.path.isfile(os.path.join(self.root, name)):
+                yield name
+
+    def build(self):
+        renames = {}
+        for name in self._files():
+            with open(os.path.join(self.root, name), 'rb') as f:
+                body = f.read()
+            if name.endswith(HASHED_EXTS):
+                stem, ext = os.path.splitext(name)
+                hashed = f'{stem}.{hashlib.sha256(body).hexdigest()[:8]}{ext}'
+                renames[name] = hashed
+                self.assets['/' + hashed] = Asset(hashed, body, IMMUTABLE)
+            # Unhashed URLs keep working for stale pages, but must revalidate
+            self.assets['/' + name] = Asset(name, body, REVALIDATE)
+
+        index = self.assets.get('/index.html')
+        if index is not None:
+            html = index.variants['identity'].decode('utf-8')
+            for name, hashed in renames.items():
+                html = re.sub(rf'''(src|href)=(["']){re.escape(name)}\2''', rf'\1=\2{hashed}\2', html)
+            self.assets['/index.html'] = Asset('index.html', html.encode('utf-8'), REVALIDATE)
+            self.assets['/'] = self.assets['/index.html']
+        self.renames = renames
+
+    def get(self, path: str):
+        return self.assets.get(path.split('?', 1)[0])
+
+    def page_assets(self) -> list:
+        """What one Mini App open downloads: index.html plus the hashed assets."""
+        return ['/index.html'] + ['/' + hashed for hashed in self.renames.values()]
+
+    def total_bytes(self, encoding: str = 'identity') -> int:
+        return sum(len(a.variants.get(encoding, a.variants['identity']))
+                   for a in map(self.assets.get, self.page_assets()))
+
+
+def negotiate(accept_encoding: str, available) -> str:
+    """Pick the best available encoding for an Accept-Encoding header (q-values honoured)."""
+    prefs = {}
+    for part in (accept_encoding or '').split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        match = re.search(r'q=([0-9.]+)', params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        prefs[token] = q
+    candidates = []
+    # Smallest first: brotli beats gzip beats identity at equal preference
+    for rank, enc in enumerate(('br', 'gzip', 'identity')):
+        if enc not in available:
+            continue
+        q = prefs.get(enc, prefs.get('*', 1.0 if enc == 'identity' else 0.0))
+        if q > 0:
+            candidates.append((q, -rank, enc))
+    return max(candidates)[2] if candidates else 'identity'
+
+
+def parse_range(header: str, size: int):
+    """Return (start, end) for a single ``bytes=`` range, None to ignore it, or 'invalid'."""
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', (header or '').strip())
+    if not match:
+        return None  # malformed or multi-range: serve the full body
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return 'invalid'
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'invalid'
+    return start, end
+
+
+CORS_HEADERS = [
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Methods', 'GET, HEAD, POST, OPTIONS'),
+    ('Access-Control-Allow-Headers', 'Content-Type, Authorization, X-Telegram-Init-Data'),
+]
+
+
+def respond(bundle: StaticBundle, path: str, headers):
+    """Answer a static GET from the bundle: returns (status, header list, body).
+
+    ``headers`` is any case-insensitive mapping of request headers, so the
+    threaded server and the aiohttp API app share this logic.
+    """
+    asset = bundle.get(path)
+    if asset is None:
+        return 404, [('Content-Type', 'text/plain; charset=utf-8')], b'Not Found'
+
+    range_header = headers.get('Range')
+    if_range = headers.get('If-Range')
+    if range_header and if_range and if_range.strip() != asset.etag('identity'):
+        range_header = None
+    # Byte ranges address the identity representation only
+    encoding = 'identity' if range_header else negotiate(headers.get('Accept-Encoding'), asset.variants)
+    body = asset.variants[encoding]
+    etag = asset.etag(encoding)
+    entity = [
+        ('ETag', etag),
+        ('Cache-Control', asset.cache_control),
+        ('Vary', 'Accept-Encoding'),
+        ('Accept-Ranges', 'bytes'),
+    ]
+    if encoding != 'identity':
+        entity.append(('Content-Encoding', encoding))
+
+    inm = headers.get('If-None-Match')
+    if inm and (inm.strip() == '*' or etag in [t.strip().removeprefix('W/') for t in inm.split(',')]):
+        return 304, entity, b''
+
+    if range_header:
+        parsed = parse_range(range_header, len(body))
+        if parsed == 'invalid':
+            return 416, [('Content-Range', f'bytes */{len(body)}')], b''
+        if parsed:
+            start, end = parsed
+            entity += [('Content-Type', asset.content_type), ('Content-Range', f'bytes {start}-{end}/{len(body)}')]
+            return 206, entity, memoryview(body)[start:end + 1]
+    return 200, entity + [('Content-Type', asset.content_type)], body
+
+
+class ProductionHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # persistent connections
+    server_version = 'ChannelAnalytics'
+    # Headers and body are separate writes; without this, Nagle + delayed ACK stall keep-alive responses
+    disable_nagle_algorithm = True
+    timeout = 30  # drop idle keep-alive connections
+    bundle = None
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        for name, value in CORS_HEADERS:
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def _serve(self, head: bool):
+        status, headers, body = respond(self.bundle, self.path, self.headers)
+        self.send_response(status)
+        for name, value in CORS_HEADERS + headers:
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body and not head:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        msg = format % args
+        if not any(ext in msg for ext in ['.css', '.js', '.ico', '.png', '.jpg', '.woff']):
+            sys.stderr.write(f"[FILE] {msg}\n")
+
+
+class ProductionServer(http.server.ThreadingHTTPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Mobile WebViews drop connections all the time; that is not a server error
+        if isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            return
+        super().handle_error(request, client_address)
+
+
+def make_production_server(port: int, root: str = ROOT, quiet: bool = False):
+    handler = type('BundleHandler', (ProductionHandler,), {'bundle': StaticBundle(root)})
+    if quiet:
+        handler.log_message = lambda self, *args: None
+    return ProductionServer(("", port), handler)
+
+
+# --- JSON API (python server.py --api) ---
+BOT_DIR = os.path.join(ROOT, 'python_bot')
+MAX_TOOL_INPUT = 4000
+MIN_JSON_COMPRESS = 1024
+API_COMPARE_MAX = int(os.getenv('API_COMPARE_MAX', '10'))
+API_RATE_PER_MIN = float(os.getenv('API_RATE_PER_MIN', '20'))
+INIT_DATA_MAX_AGE = int(os.getenv('API_INIT_DATA_MAX_AGE', '86400'))
+# Routes that spend YouTube quota or Groq tokens
+COSTLY_ROUTES = ('/api/channel', '/api/compare', '/api/ai/')
+
+
+def check_init_data(init_data: str, bot_token: str, max_age: int = INIT_DATA_MAX_AGE):
+    """Validate Telegram WebApp initData; returns its user dict, or None if forged or stale.
+
+    https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app
+    """
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received = fields.pop('hash', '')
+    check_string = '\n'.join(f'{k}={v}' for k, v in sorted(fields.items()))
+    secret = hmac.new(b'WebAppData', bot_token.encode(), hashlib.sha256).digest()
+    expected = hmac.new(secret, check_string.encode(), hashlib.sha256).hexdigest()
+    if not received or not hmac.compare_digest(expected, received):
+        return None
+    try:
+        auth_date = int(fields.get('auth_date', 0))
+        user = json.loads(fields.get('user', '{}'))
+    except ValueError:
+        return None
+    if time.time() - auth_date > max_age or not isinstance(user, dict):
+        return None
+    return user
+
+
+class RateLimiter:
+    """Token bucket per client: ``rate`` requests per minute, bursting up to the same number."""
+
+    MAX_CLIENTS = 10000
+
+    def __init__(self, rate: float = API_RATE_PER_MIN):
+        self.capacity = max(1.0, rate)
+        self.refill = rate / 60
+        self.buckets = {}  # client -> [tokens, last update]
+
+    def take(self, client: str) -> float:
+        """Spend one token; returns 0 on success or the seconds until one is available."""
+        now = time.monotonic()
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            if len(self.buckets) >= self.MAX_CLIENTS:
+                self._prune(now)
+            bucket = self.buckets[client] = [self.capacity, now]
+        bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.refill)
+        bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.refill if self.refill else 60.0
+
+    def _prune(self, now: float):
+        # Buckets that have refilled completely carry no state worth keeping
+        full = [c for c, (tokens, last) in self.buckets.items()
+                if tokens + (now - last) * self.refill >= self.capacity]
+        for client in full or list(self.buckets)[:len(self.buckets) // 2]:
+            del self.buckets[client]
+
+
+class JsonApi:
+    """Mini App endpoints backed by the bot's cached, coalesced, pooled fetch layer."""
+
+    def __init__(self, svc, telemetry, bundle: StaticBundle):
+        self.svc = svc
+        self.telemetry = telemetry
+        self.bundle = bundle
+
+    def json(self, request, payload, status: int = 200, max_age: int = 0):
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        headers = dict(CORS_HEADERS)
+        if status == 200 and max_age:
+            # Shared caches (CDN, WebView) may keep it briefly and serve stale while revalidating
+            etag = f'"{hashlib.sha256(body).hexdigest()[:20]}"'
+            headers.update({
+                'ETag': etag,
+                'Cache-Control': f'public, max-age={max_age}, stale-while-revalidate={max_age * 5}',
+            })
+            inm = request.headers.get('If-None-Match', '')
+            if etag in [t.strip().removeprefix('W/') for t in inm.split(',')]:
+                return web.Response(status=304, headers=headers)
+        else:
+            headers['Cache-Control'] = 'no-store'
+        response = web.Response(status=status, body=body, content_type='application/json',
+                                charset='utf-8', headers=headers)
+        if len(body) >= MIN_JSON_COMPRESS:
+            response.enable_compression()
+        return response
+
+    def error(self, request, status: int, message: str):
+        return self.json(request, {'error': message}, status=status)
+
+    async def channel(self, request):
+        query = request.query.get('q', '').strip()
+        if not query:
+            return self.error(request, 400, 'Missing ?q= (channel link, @handle or channel ID)')
+        data, err = await self.svc.fetch_youtube_data(query)
+        if data is None:
+            return self.error(request, err.status, str(err))
+        # Per-request timings would make every body (and so the ETag) unique
+        channel = {k: v for k, v in data.items() if k != 'timings'}
+        return self.json(request, {'channel': channel}, max_age=int(self.svc.channel_stats_cache.ttl))
+
+    async def compare(self, request):
+        queries = [q.strip() for q in re.split(r'[,\n]', request.query.get('q', '')) if q.strip()]
+        queries = list(dict.fromkeys(queries))
+        if not queries:
+            return self.error(request, 400, 'Missing ?q= (comma-separated channels)')
+        limit = min(API_COMPARE_MAX, self.svc.COMPARE_MAX_CHANNELS)
+        if len(queries) > limit:
+            return self.error(request, 400, f'At most {limit} channels per request')
+        try:
+            rows, failed = await self.svc.compare_channels(queries)
+        except self.svc.YouTubeError as e:
+            return self.error(request, e.status, str(e))
+        return self.json(request, {'channels': rows, 'failed': failed},
+                         max_age=int(self.svc.channel_stats_cache.ttl))
+
+    async def ai_tool(self, request):
+        tool = request.match_info['tool']
+        if tool not in self.svc.TOOL_PROMPTS and tool != 'tips':
+            return self.error(request, 404, f'Unknown tool: {tool}')
+        try:
+            payload = await request.json()
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict):
+            return self.error(request, 400, 'Body must be a JSON object: {"input": "..."}')
+        user_input = str(payload.get('input', '')).strip()
+        if not user_input:
+            return self.error(request, 400, 'Missing "input"')
+        if len(user_input) > MAX_TOOL_INPUT:
+            return self.error(request, 413, f'"input" is limited to {MAX_TOOL_INPUT} characters')
+        use_cache = not payload.get('regenerate', False)
+
+        if tool == 'tips':
+            # Tips take a channel and reuse the same cached channel fetch as /api/channel
+            data, err = await self.svc.fetch_youtube_data(user_input)
+            if data is None:
+                return self.error(request, err.status, str(err))
+            text, cached, err = await self.svc.complete_cached(
+                'tips', self.svc.build_tips_prompt(data), max_tokens=1024, lane='short', use_cache=use_cache
+            )
+        else:
+            text, cached, err = await self.svc.run_tool(tool, user_input, use_cache=use_cache)
+        if err:
+            return self.error(request, 503 if err == self.svc.GROQ_OVERLOADED else 502, err)
+        return self.json(request, {'tool': tool, 'text': text, 'cached': cached})
+
+    async def health(self, request):
+        # Quota and key fingerprints are operator data: same token as /metrics
+        if not self.telemetry.authorized(request):
+            return self.error(request, 401, 'Unauthorized')
+        return self.json(request, {
+            'ok': True,
+            'caches': {c.name: c.snapshot() for c in (self.svc.channel_id_cache, self.svc.channel_stats_cache,
+                                                      self.svc.latest_video_cache)},
+            'llm_cache': self.svc.llm_cache.snapshot(),
+            'groq': self.svc.groq_scheduler.snapshot(),
+            'http': self.svc.http.snapshot(),
+            'quota': self.svc.quota.snapshot(),
+        })
+
+    async def options(self, request):
+        return web.Response(status=204, headers=dict(CORS_HEADERS))
+
+    async def static(self, request):
+        status, headers, body = respond(self.bundle, request.path, request.headers)
+        # aiohttp drops the body itself for HEAD requests
+        return web.Response(status=status, body=bytes(body), headers=dict(CORS_HEADERS + headers))
+
+
+def create_api_app(root: str = ROOT):
+    """aiohttp app serving the static bundle plus /api/*; needs python_bot's requirements."""
+    if web is None:
+        raise RuntimeError("--api needs aiohttp: pip install -r python_bot/requirements.txt")
+    if BOT_DIR not in sys.path:
+        sys.path.insert(0, BOT_DIR)
+    import services  # the bot's fetch layer; no BOT_TOKEN required
+    import telemetry
+    from quota import spend_as
+    from resolver import SearchBudget, search_budget
+
+    bot_token = os.getenv('BOT_TOKEN')
+    limiter = RateLimiter()
+    if not bot_token:
+        print("[WARN] BOT_TOKEN is not set: /api accepts requests without Telegram initData "
+              "(rate limit per IP only)")
+
+    @web.middleware
+    async def guard(request, handler):
+        """Costly routes need valid Mini App initData (when BOT_TOKEN is known) and are rate limited."""
+        if request.method == 'OPTIONS' or not request.path.startswith(COSTLY_ROUTES):
+            return await handler(request)
+        client = request.remote or '?'
+        if bot_token:
+            user = check_init_data(request.headers.get('X-Telegram-Init-Data', ''), bot_token)
+            if user is None:
+                return web.json_response({'error': 'Open this from the Telegram Mini App (initData missing or invalid)'},
+                                         status=401, headers=dict(CORS_HEADERS))
+            client = f"tg:{user.get('id')}"
+        retry_after = limiter.take(client)
+        if retry_after:
+            return web.json_response({'error': 'Too many requests'}, status=429,
+                                     headers={**dict(CORS_HEADERS), 'Retry-After': str(int(retry_after) + 1)})
+        return await handler(request)
+
+    @web.middleware
+    async def quota_feature(request, handler):
+        # YouTube units spent by the Mini App show up as api:channel, api:compare, ...
+        if not request.path.startswith('/api/'):
+            return await handler(request)
+        token = search_budget.set(SearchBudget(0))  # 100-unit search.list is for the bot only
+        try:
+            with spend_as('api:' + request.path[len('/api/'):]):
+                return await handler(request)
+        finally:
+            search_budget.reset(token)
+
+    api = JsonApi(services, telemetry, StaticBundle(root))
+    app = web.Application(client_max_size=64 * 1024, middlewares=[guard, quota_feature])
+    app.router.add_get('/api/channel', api.channel)
+    app.router.add_get('/api/compare', api.compare)
+    app.router.add_post('/api/ai/{tool}', api.ai_tool)
+    app.router.add_get('/api/health', api.health)
+    app.router.add_get('/metrics', telemetry.metrics_handler)
+    app.router.add_route('OPTIONS', '/{path:.*}', api.options)
+    app.router.add_get('/{path:.*}', api.static)  # GET also answers HEAD
+
+    async def startup(app):
+        await services.start()
+
+    async def cleanup(app):
+        await services.close()
+
+    app.on_startup.append(startup)
+    app.on_cleanup.append(cleanup)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Channel Analytics Pro static server")
+    parser.add_argument('--prod', action='store_true',
+                        help='threaded keep-alive server with precompression, ETags and immutable hashed assets')
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', PORT)))
+    parser.add_argument('--api', action='store_true',
+                        help='async server: production static files plus the /api JSON endpoints')
+    args = parser.parse_args()
+
+    if args.api:
+        print(f"[OK] Channel Analytics Pro (api): http://localhost:{args.port}")
+        print("     /api/channel?q=  /api/compare?q=  POST /api/ai/{titles|hooks|script|tips}")
         sys.stdout.flush()
+        web.run_app(create_api_app(), port=args.port, print=None)
+        return
+    if args.prod:
+        httpd = make_production_server(args.port)
+        bundle = httpd.RequestHandlerClass.bundle
+        encodings = 'br, gzip' if brotli is not None else 'gzip'
+        print(f"[OK] Channel Analytics Pro (prod): http://localhost:{args.port}")
+        print(f"     {len(bundle.renames)} hashed assets, precompressed: {encodings}")
+        print(f"     Page weight: {bundle.total_bytes() // 1024} KB raw, "
+              f"{bundle.total_bytes('gzip') // 1024} KB gzip")
+    else:
+        httpd = ReuseAddrServer(("", args.port), CORSHTTPRequestHandler)
+        print(f"[OK] Channel Analytics Pro: http://localhost:{args.port}")
+    print(f"     AI: Groq API (direct from browser, no proxy)")
+    print(f"     Press Ctrl+C to stop.")
+    sys.stdout.flush()
+    with httpd:
         httpd.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
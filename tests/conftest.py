@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+# The bot modules import each other as top-level modules, like bot.py does when run from python_bot/
+sys.path.insert(0, os.path.join(ROOT, "python_bot"))
+sys.path.insert(0, ROOT)
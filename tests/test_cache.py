@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+import cache
+from cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    c = TTLCache("t", ttl=10)
+    c.set("k", 1)
+    clock.now += 10
+    assert c.get("k") == 1
+    clock.now += 0.1
+    assert c.get("k") is None
+    assert len(c) == 0
+    assert c.stats["hits"] == 1 and c.stats["misses"] == 1
+
+
+def test_stale_entries_are_not_returned_by_get(clock):
+    c = TTLCache("t", ttl=10, stale_ttl=20)
+    c.set("k", 1)
+    clock.now += 15
+    assert c.get("k", "default") == "default"
+    # Still held for stale-while-revalidate until ttl + stale_ttl
+    assert len(c) == 1
+    clock.now += 16
+    assert c.get("k") is None
+    assert len(c) == 0
+
+
+def test_lru_eviction_keeps_recently_used_entries(clock):
+    c = TTLCache("t", ttl=60, max_entries=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert c.get("a") == 1 and c.get("c") == 3
+    assert c.stats["evictions"] == 1
+
+
+def test_get_or_fetch_serves_stale_and_refreshes_once(clock):
+    c = TTLCache("t", ttl=10, stale_ttl=60)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return len(calls)
+
+    async def run():
+        assert await c.get_or_fetch("k", fetch) == 1
+        assert await c.get_or_fetch("k", fetch) == 1
+        clock.now += 30
+        # Two stale reads share one background refresh
+        assert await c.get_or_fetch("k", fetch) == 1
+        assert await c.get_or_fetch("k", fetch) == 1
+        await asyncio.gather(*c._tasks)
+        assert await c.get_or_fetch("k", fetch) == 2
+
+    asyncio.run(run())
+    assert len(calls) == 2
+    assert c.stats["stale_hits"] == 2 and c.stats["refreshes"] == 1
+
+
+def test_get_or_fetch_without_refresh_leaves_stale_entry(clock):
+    c = TTLCache("t", ttl=10, stale_ttl=60)
+
+    async def fetch():
+        return "new"
+
+    async def run():
+        c.set("k", "old")
+        clock.now += 30
+        assert await c.get_or_fetch("k", fetch, refresh=False) == "old"
+        assert not c._tasks
+
+    asyncio.run(run())
+
+
+def test_get_or_fetch_does_not_cache_none(clock):
+    c = TTLCache("t", ttl=10)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return None
+
+    async def run():
+        assert await c.get_or_fetch("k", fetch) is None
+        assert await c.get_or_fetch("k", fetch) is None
+
+    asyncio.run(run())
+    assert len(calls) == 2
@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+import quota
+from quota import NO_SEARCH, NORMAL, SERVE_STALE, SKIP_LATEST, QuotaExceeded, QuotaManager
+
+
+def test_parse_keys():
+    assert quota.parse_keys(" KEY1:3, KEY2 ,,") == [("KEY1", 3), ("KEY2", 1)]
+    assert quota.parse_keys("") == []
+
+
+def test_quota_day_follows_pacific_midnight():
+    # 2026-03-10 is in PDT (UTC-7)
+    assert quota.quota_day(datetime(2026, 3, 10, 6, 59, tzinfo=timezone.utc)) == "2026-03-09"
+    assert quota.quota_day(datetime(2026, 3, 10, 7, 0, tzinfo=timezone.utc)) == "2026-03-10"
+    # 2026-01-15 is in PST (UTC-8)
+    assert quota.quota_day(datetime(2026, 1, 15, 7, 59, tzinfo=timezone.utc)) == "2026-01-14"
+    assert quota.seconds_until_reset(datetime(2026, 1, 15, 7, 0, tzinfo=timezone.utc)) == 3600
+
+
+def test_weighted_rotation_is_smooth():
+    manager = QuotaManager([("a", 3), ("b", 1)], daily_limit=1000)
+    picks = [manager.acquire("channels").key for _ in range(8)]
+    # 3:1 split, interleaved rather than three a's in a row then a b
+    assert picks == ["a", "a", "b", "a"] * 2
+
+
+def test_rotation_skips_keys_without_budget():
+    manager = QuotaManager([("a", 1), ("b", 1)], daily_limit=150)
+    manager.mark_exhausted(manager.keys[0])
+    assert manager.acquire("search").key == "b"
+    # b has 49 units left: enough for channels, not for another search
+    with pytest.raises(QuotaExceeded):
+        manager.acquire("search")
+    assert manager.acquire("channels").key == "b"
+    assert manager.stats["refused"] == 1
+
+
+def test_spend_is_attributed_to_the_feature():
+    manager = QuotaManager([("a", 1)], daily_limit=1000)
+    with quota.spend_as("deep"):
+        manager.acquire("playlistItems")
+    manager.acquire("search")
+    assert manager.features == {"deep": 1, "other": 100}
+    assert manager.endpoints == {"playlistItems": 1, "search": 100}
+
+
+def test_levels_follow_thresholds():
+    manager = QuotaManager([("a", 1)], daily_limit=100, thresholds=(0.5, 0.7, 0.9))
+    key = manager.keys[0]
+    for used, expected in ((0, NORMAL), (50, SERVE_STALE), (70, SKIP_LATEST), (95, NO_SEARCH)):
+        key.used = used
+        assert manager.level() == expected
+
+
+def test_pacific_day_rollover_resets_counters(monkeypatch):
+    monkeypatch.setattr(quota, "quota_day", lambda now=None: "2026-03-09")
+    manager = QuotaManager([("a", 1)], daily_limit=100)
+    manager.acquire("search")
+    with pytest.raises(QuotaExceeded):
+        manager.acquire("search")
+    assert manager.used() == 100
+
+    monkeypatch.setattr(quota, "quota_day", lambda now=None: "2026-03-10")
+    assert manager.level() == NORMAL
+    assert manager.used() == 0 and manager.features == {}
+    manager.acquire("channels")
+    # Unflushed spend stays under the day it was charged
+    key_id = manager.keys[0].id
+    assert manager._pending == {
+        ("2026-03-09", key_id, "other", "search"): 100,
+        ("2026-03-10", key_id, "other", "channels"): 1,
+    }
+
+
+def test_spend_persists_per_day(tmp_path, monkeypatch):
+    monkeypatch.setattr(quota, "quota_day", lambda now=None: "2026-03-09")
+    path = str(tmp_path / "quota.db")
+
+    async def run():
+        manager = QuotaManager([("a", 1)], daily_limit=1000, path=path)
+        await manager.start()
+        manager.acquire("search")
+        await manager.close()
+
+        restarted = QuotaManager([("a", 1)], daily_limit=1000, path=path)
+        await restarted.start()
+        assert restarted.used() == 100
+        await restarted.close()
+
+        monkeypatch.setattr(quota, "quota_day", lambda now=None: "2026-03-10")
+        next_day = QuotaManager([("a", 1)], daily_limit=1000, path=path)
+        await next_day.start()
+        assert next_day.used() == 0
+        await next_day.close()
+
+    asyncio.run(run())
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+import resolver
+from resolver import ChannelIndex, parse_channel_input
+
+CHANNEL_ID = "UCX6OQ3DkcsbYNE6H8uQQuVA"
+
+
+@pytest.mark.parametrize("query, expected", [
+    (CHANNEL_ID, ("id", CHANNEL_ID)),
+    (f"  {CHANNEL_ID}  ", ("id", CHANNEL_ID)),
+    (f"https://www.youtube.com/channel/{CHANNEL_ID}", ("id", CHANNEL_ID)),
+    ("@MrBeast", ("handle", "MrBeast")),
+    ("@MrBeast/videos", ("handle", "MrBeast")),
+    ("https://www.youtube.com/@MrBeast/shorts", ("handle", "MrBeast")),
+    ("youtube.com/@MrBeast", ("handle", "MrBeast")),
+    ("https://m.youtube.com/@MrBeast", ("handle", "MrBeast")),
+    ("https://www.youtube.com/user/PewDiePie", ("username", "PewDiePie")),
+    ("https://www.youtube.com/c/Veritasium", ("custom", "Veritasium")),
+    ("https://www.youtube.com/Veritasium", ("custom", "Veritasium")),
+    ("https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=42", ("video", "dQw4w9WgXcQ")),
+    ("https://youtu.be/dQw4w9WgXcQ?si=abc", ("video", "dQw4w9WgXcQ")),
+    ("https://www.youtube.com/shorts/dQw4w9WgXcQ", ("video", "dQw4w9WgXcQ")),
+    ("https://www.youtube.com/live/dQw4w9WgXcQ", ("video", "dQw4w9WgXcQ")),
+    ("MrBeast", ("handle", "MrBeast")),
+    ("mr beast gaming", ("search", "mr beast gaming")),
+    ("https://www.youtube.com/", ("search", "https://www.youtube.com/")),
+])
+def test_parse_channel_input(query, expected):
+    assert parse_channel_input(query) == expected
+
+
+def test_parse_channel_input_does_not_trust_lookalike_hosts():
+    assert parse_channel_input("https://notyoutube.com/@MrBeast")[0] == "search"
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resolver.time, "time", clock)
+    return clock
+
+
+def test_index_keys_handles_case_insensitively(clock):
+    index = ChannelIndex()
+    asyncio.run(index.put("handle", "MrBeast", CHANNEL_ID))
+    assert index.get("handle", "mrbeast") == CHANNEL_ID
+    assert index.get("video", "dQw4w9WgXcQ") is None
+
+
+def test_index_bounds_searched_entries_lru(clock):
+    persisted = []
+    index = ChannelIndex(persist=lambda *args: persisted.append(args), search_max=2)
+
+    async def fill():
+        await index.put("search", "first", "UC1", searched=True)
+        await index.put("search", "second", "UC2", searched=True)
+        index.get("search", "first")  # now most recently used
+        await index.put("search", "third", "UC3", searched=True)
+        await index.put("handle", "exact", "UC4")
+
+    asyncio.run(fill())
+    assert index.get("search", "second") is None
+    assert index.get("search", "first") == "UC1"
+    assert index.get("search", "third") == "UC3"
+    assert index.get("handle", "exact") == "UC4"
+    assert len(index) == 3
+    assert index.evictions == 1
+    # The eviction is written through as a delete; exact mappings carry no timestamp
+    assert ("search:second", None, None) in persisted
+    assert ("handle:exact", "UC4", None) in persisted
+
+
+def test_index_expires_searched_entries(clock):
+    index = ChannelIndex(search_ttl=60)
+    asyncio.run(index.put("handle", "cooking", "UC1", searched=True))
+    clock.now += 59
+    assert index.get("handle", "cooking") == "UC1"
+    clock.now += 2
+    assert index.get("handle", "cooking") is None
+    assert len(index) == 0
+
+
+def test_index_load_drops_expired_and_overflowing_entries(clock):
+    deleted = []
+    index = ChannelIndex(persist=lambda key, channel_id, ts: deleted.append(key), search_max=1, search_ttl=60)
+    index.load({
+        "handle:kept": ("UC0", None),
+        "search:expired": ("UC1", clock.now - 120),
+        "search:older": ("UC2", clock.now - 20),
+        "search:newer": ("UC3", clock.now - 10),
+    })
+    assert index.get("handle", "kept") == "UC0"
+    assert index.get("search", "newer") == "UC3"
+    assert index.get("search", "older") is None
+    assert sorted(deleted) == ["search:expired", "search:older"]
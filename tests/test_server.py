@@ -0,0 +1,42 @@
+import pytest
+
+from server import negotiate, parse_range
+
+ALL = ("br", "gzip", "identity")
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    (" bytes=0-0 ", (0, 0)),
+    ("bytes=1000-", "invalid"),
+    ("bytes=50-10", "invalid"),
+    ("bytes=-0", "invalid"),
+    ("bytes=-", None),
+    ("bytes=0-1,5-9", None),
+    ("items=0-9", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header, available, expected", [
+    ("gzip, deflate, br", ALL, "br"),
+    ("gzip, deflate, br", ("gzip", "identity"), "gzip"),
+    ("br;q=0.5, gzip", ALL, "gzip"),
+    ("BR;Q=1.0, GZIP;q=0.8", ALL, "br"),
+    ("br;q=0, gzip;q=0", ALL, "identity"),
+    ("*", ALL, "br"),
+    ("*;q=0, identity;q=0", ALL, "identity"),
+    ("gzip;q=abc, br", ALL, "br"),
+    ("", ALL, "identity"),
+    (None, ALL, "identity"),
+    ("deflate", ALL, "identity"),
+])
+def test_negotiate(header, available, expected):
+    assert negotiate(header, available) == expected
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+class Upstream:
+    """Counts calls and blocks each one until ``release`` is set."""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.cancelled = False
+
+    async def fetch(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return "result"
+
+
+def test_concurrent_calls_share_one_execution():
+    async def run():
+        flight, upstream = SingleFlight("t"), Upstream()
+        waiters = [asyncio.create_task(flight.do("k", upstream.fetch)) for _ in range(5)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        assert await asyncio.gather(*waiters) == ["result"] * 5
+        assert upstream.calls == 1
+        assert flight.stats == {"calls": 5, "executions": 1, "coalesced": 4}
+        assert flight.snapshot()["inflight"] == 0
+
+        # Nothing is kept after completion: the next call runs again
+        assert await flight.do("k", upstream.fetch) == "result"
+        assert upstream.calls == 2
+
+    asyncio.run(run())
+
+
+def test_different_keys_do_not_coalesce():
+    async def run():
+        flight, upstream = SingleFlight("t"), Upstream()
+        upstream.release.set()
+        await asyncio.gather(flight.do("a", upstream.fetch), flight.do("b", upstream.fetch))
+        assert upstream.calls == 2
+
+    asyncio.run(run())
+
+
+def test_exception_reaches_every_waiter():
+    async def boom():
+        await asyncio.sleep(0)
+        raise ValueError("upstream down")
+
+    async def run():
+        flight = SingleFlight("t")
+        results = await asyncio.gather(flight.do("k", boom), flight.do("k", boom), return_exceptions=True)
+        assert [type(r) for r in results] == [ValueError, ValueError]
+        assert flight.stats["executions"] == 1
+
+    asyncio.run(run())
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def run():
+        flight, upstream = SingleFlight("t"), Upstream()
+        leader = asyncio.create_task(flight.do("k", upstream.fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("k", upstream.fetch))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        upstream.release.set()
+        assert await follower == "result"
+        assert upstream.calls == 1 and not upstream.cancelled
+
+    asyncio.run(run())
+
+
+def test_call_is_cancelled_when_every_waiter_leaves():
+    async def run():
+        flight, upstream = SingleFlight("t"), Upstream()
+        waiters = [asyncio.create_task(flight.do("k", upstream.fetch)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert upstream.cancelled
+        assert flight.snapshot()["inflight"] == 0
+
+        # A fresh call after the abandoned one starts a new execution
+        upstream.release.set()
+        assert await flight.do("k", upstream.fetch) == "result"
+        assert upstream.calls == 2
+
+    asyncio.run(run())